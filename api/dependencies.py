@@ -0,0 +1,14 @@
+from fastapi import Depends, Request
+from pymongo.asynchronous.database import AsyncDatabase
+
+from database.timeseries import SensorDataLayout, sensor_data_layout_async
+
+
+def get_db(request: Request) -> AsyncDatabase:
+    """FastAPI dependency: the async database opened by the app's lifespan."""
+    return request.app.state.db
+
+
+async def get_sensor_data_layout(db: AsyncDatabase = Depends(get_db)) -> SensorDataLayout:
+    """FastAPI dependency: whether sensor_data keeps sensor_id / device_id in meta."""
+    return await sensor_data_layout_async(db)
@@ -1,16 +1,53 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from fastapi import Depends, FastAPI, Query, Request
+from fastapi.responses import PlainTextResponse
+from api.metrics import render_metrics, timing_middleware
+from api.dependencies import get_db
+from database.slow_queries import SLOW_QUERIES, slow_query_summary_pipeline
+from database.indexes import prepare_indexes_async
+from database.timeseries import sensor_data_layout_async
+from database.connection import close_async_client, close_client, get_async_database, get_pool_stats
+from services.idempotency import ensure_message_id_index_async
+from services.reading_cache import ensure_last_readings_index_async
+from services.rollups import ensure_rollup_indexes_async
+from services.search import search_backfill_done_async
 from api.routes.user_routes import router as user_router
 from api.routes.location_routes import router as location_router
 from api.routes.device_routes import router as device_router
 from api.routes.sensor_routes import router as sensor_router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One async Mongo client for the whole process, shared by every route
+    app.state.db = get_async_database()
+    await ensure_rollup_indexes_async(app.state.db)
+    await ensure_last_readings_index_async(app.state.db)
+    layout = await sensor_data_layout_async(app.state.db)
+    await ensure_message_id_index_async(app.state.db, layout.timeseries)
+    # Every index the routes rely on, then a COLLSCAN check of the hot queries
+    await prepare_indexes_async(app.state.db, layout.timeseries)
+    # The backfill is a full scan, so it runs offline, not on every startup
+    if not await search_backfill_done_async(app.state.db):
+        print("[Search] ⚠️ Search fields not backfilled; older devices / locations won't match text filters. "
+              "Run: python services/search.py")
+    yield
+    await close_async_client()
+    close_client()
+
+
 app = FastAPI(root_path="/api")
 app = FastAPI(
     title="IoT Device Management API",
     description="APIs to manage users, locations, devices, sensors, and data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per-route latency histogram and a Server-Timing header (db / app / serialize)
+app.middleware("http")(timing_middleware)
+
 # Fixed route prefix to match service_layer.py (which sends to /api/sensor-data)
 app.include_router(user_router, prefix="/users", tags=["Users"])
 app.include_router(location_router, prefix="/location", tags=["Locations"])
@@ -21,3 +58,27 @@ app.include_router(sensor_router, prefix="/sensors", tags=["Sensors"])
 @app.get("/")
 def root():
     return {"message": "Welcome to the IoT Device Management API!"}
+
+
+@app.get("/db/pool")
+def db_pool_stats():
+    """Connection pool counters for this API process."""
+    return get_pool_stats()
+
+
+@app.get("/db/slow-queries")
+async def slow_query_summary(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    limit: int = Query(10, ge=1, le=100),
+    db=Depends(get_db),
+):
+    """Query shapes slower than SLOW_QUERY_MS, worst total time first, with their latest explain."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    cursor = await db[SLOW_QUERIES].aggregate(slow_query_summary_pipeline(since, limit))
+    return await cursor.to_list(None)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, Mongo command and pool metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,111 @@
+import inspect
+import time
+from functools import wraps
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+from database.connection import command_metrics, get_pool_stats
+from database.monitoring import Histogram, RequestTiming, render_prometheus, request_timing
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "API request latency, to the start of the response",
+    ("method", "route", "status"),
+)
+
+
+def _timed_endpoint(endpoint):
+    """Marks when the route function returns, so serialization can be told apart."""
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timing = request_timing.get()
+                if timing is not None:
+                    timing.mark_handler_done()
+    else:
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                timing = request_timing.get()
+                if timing is not None:
+                    timing.mark_handler_done()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute whose endpoint reports when it returned (see Server-Timing)."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+
+def server_timing(timing: RequestTiming, started: float, finished: float) -> str:
+    """db = Mongo round trips, app = everything else up to the route's return,
+    serialize = response model validation and encoding after it. Routes that
+    return a MongoJSONResponse encode before returning, so that lands in app."""
+    total = finished - started
+    if timing.handler_done is None:
+        parts = {"db": timing.db, "app": max(total - timing.db, 0.0)}
+    else:
+        db_after = timing.db - timing.db_at_handler_done
+        parts = {
+            "db": timing.db,
+            "app": max(timing.handler_done - started - timing.db_at_handler_done, 0.0),
+            "serialize": max(finished - timing.handler_done - db_after, 0.0),
+        }
+    parts["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in parts.items())
+
+
+def route_label(scope) -> str:
+    """The matched route's template with its router prefix, e.g. /sensors/{sensor_id}/last-data."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Included routers may not rewrite route.path with their prefix, so
+    # recover the prefix from the concrete path
+    rendered = route.path_format
+    for name, value in scope.get("path_params", {}).items():
+        rendered = rendered.replace("{" + name + "}", str(value))
+    path = scope.get("path", "")
+    prefix = path[: -len(rendered)] if rendered and path.endswith(rendered) else ""
+    return prefix + route.path_format
+
+
+async def timing_middleware(request: Request, call_next):
+    timing = RequestTiming()
+    token = request_timing.set(timing)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timing.reset(token)
+    finished = time.perf_counter()
+
+    # Label by route template, not the raw path, to keep the series bounded.
+    # Streaming responses are timed to their first byte
+    request_duration.observe((request.method, route_label(request.scope), str(response.status_code)), finished - started)
+    response.headers["Server-Timing"] = server_timing(timing, started, finished)
+    return response
+
+
+def _pool_lines():
+    stats = get_pool_stats()
+    clients = {client: stats[client] for client in ("sync", "async") if stats[client]}
+    lines = []
+    for key in next(iter(clients.values()), {}):
+        lines.append(f"# TYPE mongodb_pool_{key} gauge")
+        for client, counters in clients.items():
+            lines.append(f'mongodb_pool_{key}{{client="{client}"}} {counters[key]}')
+    return lines
+
+
+def render_metrics() -> str:
+    text = render_prometheus([request_duration] + command_metrics.metrics())
+    pool = _pool_lines()
+    return text + ("\n".join(pool) + "\n" if pool else "")
@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+# (field, direction) pairs, e.g. [("created_at", 1), ("_id", 1)]
+SortKeys = Sequence[Tuple[str, int]]
+
+
+def _pack(value: Any) -> Dict[str, Any]:
+    if isinstance(value, datetime):
+        return {"d": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"o": str(value)}
+    return {"v": value}
+
+
+def _unpack(item: Dict[str, Any]) -> Any:
+    if "d" in item:
+        return datetime.fromisoformat(item["d"])
+    if "o" in item:
+        return ObjectId(item["o"])
+    return item["v"]
+
+
+def encode_token(values: Sequence[Any]) -> str:
+    """Opaque `next` token for the sort-key values of the last returned document."""
+    raw = json.dumps([_pack(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        return [_unpack(item) for item in json.loads(raw)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination token")
+
+
+def keyset_filter(sort_keys: SortKeys, values: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Filter matching documents strictly after `values` in `sort_keys` order.
+
+    For [("created_at", 1), ("_id", 1)] this is
+    {"$or": [{"created_at": {"$gt": t}}, {"created_at": t, "_id": {"$gt": id}}]}.
+    """
+    if len(values) != len(sort_keys):
+        raise HTTPException(status_code=400, detail="Invalid pagination token")
+
+    branches = []
+    for i, (field, direction) in enumerate(sort_keys):
+        branch = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort_keys[:i])}
+        branch[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        branches.append(branch)
+    return {"$or": branches} if len(branches) > 1 else branches[0]
+
+
+def next_token(doc: Dict[str, Any], sort_keys: SortKeys) -> str:
+    return encode_token([doc.get(field) for field, _ in sort_keys])
+
+
+def field_projection(fields: str, allowed: Sequence[str]) -> Dict[str, int]:
+    """Inclusion projection for a comma-separated `fields` parameter."""
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown) or fields!r}; allowed: {', '.join(allowed)}")
+    # A parent already includes its sub-fields (and both would be a path collision)
+    return {f: 1 for f in wanted if not any(f.startswith(p + ".") for p in wanted)}
+
+
+def split_page(docs: List[Dict[str, Any]], limit: int, sort_keys: SortKeys) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim a limit + 1 fetch to one page; the `next` token if there is more."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, next_token(docs[-1], sort_keys)
+
+
+async def count_total(collection, query: Dict[str, Any], mode: Optional[str]) -> Optional[int]:
+    """
+    `total` for a list route: "estimate" reads the collection's metadata count
+    (instant, but includes soft-deleted documents and ignores filters),
+    "exact" counts the matches.
+    """
+    if mode == "estimate":
+        return await collection.estimated_document_count()
+    if mode == "exact":
+        return await collection.count_documents(query)
+    return None
@@ -0,0 +1,38 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.encoders import decimal_encoder
+from fastapi.responses import JSONResponse
+
+
+def bson_default(value: Any) -> Any:
+    """orjson fallback for the BSON types Mongo documents carry (datetimes are native)."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, Decimal):
+        return decimal_encoder(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=bson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    JSON straight from Mongo documents, in one orjson pass.
+
+    Returning one from a route skips FastAPI's jsonable_encoder walk and any
+    response_model validation, so use it only for trusted projections of
+    stored documents. Output matches jsonable_encoder for the types Mongo
+    returns (ISO datetimes, ObjectId as a string).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,13 +1,29 @@
-from fastapi import APIRouter, HTTPException
+import re
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi import Query
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timezone
 from uuid import uuid4
-from database import db  # assumes your MongoDB connection is in database/db.py
-
-router = APIRouter()
+from pymongo.asynchronous.database import AsyncDatabase
+from api.dependencies import get_db
+from api.metrics import TimedRoute
+from api.pagination import decode_token, field_projection, keyset_filter, split_page
+from api.responses import MongoJSONResponse
+from services.search import SEARCH_PROJECTION, combine, rank_stage, search_fields, search_filter, with_search
+
+router = APIRouter(route_class=TimedRoute)
+
+DEVICE_PROJECTION = {"_id": 0, **SEARCH_PROJECTION}
+# Fields /devices/filter?fields= may ask for
+DEVICE_FIELDS = (
+    "device_id", "location_id", "location_mark", "device_name", "created_at", "updated_at", "sensors",
+    "sensors.sensor_id", "sensors.sensor_name", "sensors.sensor_specification", "sensors.location_id",
+)
+DEVICE_SORT = [("_id", 1)]
+RANKED_SORT = [("_score", -1), ("_id", 1)]
+DEFAULT_FILTER_LIMIT = 100
+MAX_FILTER_LIMIT = 1000
 
 # ------------ Models ------------
 class SensorModel(BaseModel):
@@ -32,29 +48,100 @@ class DeviceUpdate(BaseModel):
 # ------------ Routes ------------
 
 @router.post("/")
-def create_device(device: DeviceCreate):
-    if db.devices.find_one({"_id": device.device_id}):
+async def create_device(device: DeviceCreate, db: AsyncDatabase = Depends(get_db)):
+    if await db.devices.find_one({"_id": device.device_id}):
         raise HTTPException(status_code=400, detail="Device ID already exists")
 
     doc = device.model_dump()
     doc["_id"] = device.device_id
     doc["created_at"] = datetime.now(timezone.utc)
     doc["is_deleted"] = False
-    db.devices.insert_one(doc)
+    await db.devices.insert_one(with_search("devices", doc))
     return {"message": "Device created", "device": doc}
 
 
+# Declared before /{device_id}, which would otherwise match "filter"
+@router.get("/filter")
+async def filter_devices(
+    device_id: Optional[str] = None,
+    location_id: Optional[str] = None,
+    location_mark: Optional[str] = None,
+    device_name: Optional[str] = None,
+    sensor_id: Optional[str] = None,
+    sensor_name: Optional[str] = None,
+    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    search: str = Query("contains", pattern="^(contains|prefix)$", description="How location_mark / device_name match (case-insensitive)"),
+    limit: int = Query(DEFAULT_FILTER_LIMIT, ge=1, le=MAX_FILTER_LIMIT),
+    after: Optional[str] = Query(None, description="`next` token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. device_id,device_name,sensors.sensor_id"),
+    db: AsyncDatabase = Depends(get_db)
+):
+    query = {"is_deleted": False}
+
+    if device_id:
+        query["_id"] = device_id
+    if location_id:
+        query["location_id"] = location_id
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
+        if created_to:
+            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
+
+    # A device matches if any sensor matches; only those sensors are returned
+    sensor_match, sensor_cond = [], []
+    if sensor_id:
+        sensor_match.append({"sensor_id": sensor_id})
+        sensor_cond.append({"$eq": ["$$s.sensor_id", sensor_id]})
+    if sensor_name:
+        sensor_match.append({"sensor_name": {"$regex": re.escape(sensor_name), "$options": "i"}})
+        sensor_cond.append({"$regexMatch": {"input": {"$ifNull": ["$$s.sensor_name", ""]}, "regex": re.escape(sensor_name), "options": "i"}})
+    if sensor_match:
+        query["sensors"] = {"$elemMatch": sensor_match[0] if len(sensor_match) == 1 else {"$or": sensor_match}}
+
+    # Text terms use the indexed search fields and rank best match first
+    terms = {f: v for f, v in (("device_name", device_name), ("location_mark", location_mark)) if v}
+    sort_keys = RANKED_SORT if terms else DEVICE_SORT
+
+    pipeline = [{"$match": combine(query, [search_filter(f, v, search) for f, v in terms.items()])}]
+    if terms:
+        pipeline.append(rank_stage(terms))
+    if after:
+        pipeline.append({"$match": keyset_filter(sort_keys, decode_token(after))})
+    # One extra document tells us whether there is a next page
+    pipeline += [{"$sort": dict(sort_keys)}, {"$limit": limit + 1}]
+    if sensor_cond:
+        pipeline.append({"$set": {"sensors": {"$filter": {
+            "input": "$sensors", "as": "s", "cond": sensor_cond[0] if len(sensor_cond) == 1 else {"$or": sensor_cond}
+        }}}})
+    # _id (and _score) stay for the next token and are dropped below
+    if fields:
+        pipeline.append({"$project": {**field_projection(fields, DEVICE_FIELDS), **{k: 1 for k, _ in sort_keys}}})
+    else:
+        pipeline.append({"$project": SEARCH_PROJECTION})
+
+    cursor = await db.devices.aggregate(pipeline)
+    devices, next_page = split_page(await cursor.to_list(), limit, sort_keys)
+    for d in devices:
+        d.pop("_id", None)
+        d.pop("_score", None)
+
+    return MongoJSONResponse({"count": len(devices), "results": devices, "next": next_page})
+
+
 @router.get("/{device_id}")
-def get_device(device_id: str):
-    device = db.devices.find_one({"_id": device_id, "is_deleted": False}, {"_id": 0})
+async def get_device(device_id: str, db: AsyncDatabase = Depends(get_db)):
+    device = await db.devices.find_one({"_id": device_id, "is_deleted": False}, DEVICE_PROJECTION)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+    return MongoJSONResponse(device)
 
 
 @router.patch("/{device_id}")
-def update_device(device_id: str, updates: DeviceUpdate):
-    existing = db.devices.find_one({"_id": device_id, "is_deleted": False})
+async def update_device(device_id: str, updates: DeviceUpdate, db: AsyncDatabase = Depends(get_db)):
+    existing = await db.devices.find_one({"_id": device_id, "is_deleted": False})
     if not existing:
         raise HTTPException(status_code=404, detail="Device not found")
 
@@ -64,9 +151,12 @@ def update_device(device_id: str, updates: DeviceUpdate):
 
     old_data = {k: existing.get(k) for k in update_data.keys()}
 
-    db.devices.update_one({"_id": device_id}, {"$set": update_data})
+    await db.devices.update_one(
+        {"_id": device_id},
+        {"$set": {**update_data, **search_fields("devices", {**existing, **update_data})}}
+    )
 
-    db.device_update_history.insert_one({
+    await db.device_update_history.insert_one({
         "_id": uuid4().hex,
         "device_id": device_id,
         "timestamp": datetime.now(timezone.utc),
@@ -78,8 +168,8 @@ def update_device(device_id: str, updates: DeviceUpdate):
 
 
 @router.delete("/{device_id}")
-def soft_delete_device(device_id: str):
-    result = db.devices.update_one(
+async def soft_delete_device(device_id: str, db: AsyncDatabase = Depends(get_db)):
+    result = await db.devices.update_one(
         {"_id": device_id, "is_deleted": False},
         {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc)}}
     )
@@ -87,53 +177,3 @@ def soft_delete_device(device_id: str):
         raise HTTPException(status_code=404, detail="Device not found or already deleted")
 
     return {"message": "Device soft-deleted successfully"}
-
-
-
-
-@router.get("/filter")
-def filter_devices(
-    device_id: Optional[str] = None,
-    location_id: Optional[str] = None,
-    location_mark: Optional[str] = None,
-    device_name: Optional[str] = None,
-    sensor_id: Optional[str] = None,
-    sensor_name: Optional[str] = None,
-    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS")
-):
-    query = {"is_deleted": False}
-
-    if device_id:
-        query["_id"] = device_id
-    if location_id:
-        query["location_id"] = location_id
-    if location_mark:
-        query["location_mark"] = {"$regex": location_mark, "$options": "i"}
-    if device_name:
-        query["device_name"] = {"$regex": device_name, "$options": "i"}
-    if created_from or created_to:
-        query["created_at"] = {}
-        if created_from:
-            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
-        if created_to:
-            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
-
-    devices = list(db.devices.find(query, {"_id": 0}))
-
-    # Filter inside sensors array if sensor_id or sensor_name given
-    if sensor_id or sensor_name:
-        filtered = []
-        for d in devices:
-            matched_sensors = []
-            for s in d.get("sensors", []):
-                if sensor_id and s.get("sensor_id") == sensor_id:
-                    matched_sensors.append(s)
-                elif sensor_name and sensor_name.lower() in s.get("sensor_name", "").lower():
-                    matched_sensors.append(s)
-            if matched_sensors:
-                d["sensors"] = matched_sensors
-                filtered.append(d)
-        return jsonable_encoder(filtered)
-
-    return jsonable_encoder(devices)
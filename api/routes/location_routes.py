@@ -1,15 +1,27 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi import Query
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
-from typing import Optional, List, Tuple
+from typing import Optional, Tuple
 from datetime import datetime, timezone
-from database.connection import get_database
-
-router = APIRouter()
-db = get_database()
-locations_collection = db["locations"]
-location_history_collection = db["location_update_history"]
+from pymongo.asynchronous.database import AsyncDatabase
+from api.dependencies import get_db
+from api.metrics import TimedRoute
+from api.pagination import count_total, decode_token, field_projection, keyset_filter, split_page
+from api.responses import MongoJSONResponse
+from services.search import SEARCH_PROJECTION, combine, rank_stage, search_fields, search_filter, with_search
+
+router = APIRouter(route_class=TimedRoute)
+
+LOCATION_PROJECTION = {"_id": 0, **SEARCH_PROJECTION}
+# Fields the list routes' ?fields= may ask for
+LOCATION_FIELDS = (
+    "location_id", "user_id", "name", "coordinates", "description", "created_at", "address",
+    "address.address_line", "address.city", "address.state", "address.country", "address.zip_code",
+)
+LOCATION_SORT = [("_id", 1)]
+RANKED_SORT = [("_score", -1), ("_id", 1)]
+DEFAULT_LIST_LIMIT = 100
+MAX_LIST_LIMIT = 1000
 
 # ----------------------------
 # Pydantic Schemas
@@ -45,30 +57,98 @@ class LocationResponse(LocationCreate):
 # ----------------------------
 
 @router.post("/", response_model=LocationResponse, status_code=status.HTTP_201_CREATED)
-def create_location(location: LocationCreate):
-    if locations_collection.find_one({"location_id": location.location_id}):
+async def create_location(location: LocationCreate, db: AsyncDatabase = Depends(get_db)):
+    if await db.locations.find_one({"location_id": location.location_id}):
         raise HTTPException(status_code=400, detail="Location already exists")
 
     location_data = location.model_dump()
     location_data["created_at"] = datetime.now(timezone.utc)
     location_data["is_deleted"] = False
-    locations_collection.insert_one(location_data)
+    await db.locations.insert_one(with_search("locations", location_data))
     return location_data
 
-@router.get("/", response_model=List[LocationResponse])
-def get_all_locations():
-    return list(locations_collection.find({"is_deleted": {"$ne": True}}, {"_id": 0}))
+@router.get("/")
+async def get_all_locations(
+    limit: int = Query(DEFAULT_LIST_LIMIT, ge=1, le=MAX_LIST_LIMIT),
+    after: Optional[str] = Query(None, description="`next` token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. location_id,name,address.city"),
+    total: Optional[str] = Query(None, pattern="^(estimate|exact)$", description="Also return a total count"),
+    db: AsyncDatabase = Depends(get_db)
+):
+    return await _location_page({"is_deleted": False}, {}, "contains", limit, after, fields, total, db)
+
+# Declared before /{location_id}, which would otherwise match "filter"
+@router.get("/filter")
+async def filter_locations(
+    user_id: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    country: Optional[str] = None,
+    name: Optional[str] = None,
+    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    search: str = Query("contains", pattern="^(contains|prefix)$", description="How city / state / country / name match (case-insensitive)"),
+    limit: int = Query(DEFAULT_LIST_LIMIT, ge=1, le=MAX_LIST_LIMIT),
+    after: Optional[str] = Query(None, description="`next` token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. location_id,name,address.city"),
+    total: Optional[str] = Query(None, pattern="^(estimate|exact)$", description="Also return a total count"),
+    db: AsyncDatabase = Depends(get_db)
+):
+    query = {"is_deleted": False}
+
+    if user_id:
+        query["user_id"] = user_id
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
+        if created_to:
+            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
+
+    # Text terms use the indexed search fields and rank best match first
+    terms = {f: v for f, v in (("address.city", city), ("address.state", state),
+                               ("address.country", country), ("name", name)) if v}
+    return await _location_page(query, terms, search, limit, after, fields, total, db)
+
+async def _location_page(query, terms, search, limit, after, fields, total, db):
+    """One page of locations (best match first when searching), plus the `next` token and optional total."""
+    sort_keys = RANKED_SORT if terms else LOCATION_SORT
+    match = combine(query, [search_filter(f, v, search) for f, v in terms.items()])
+
+    pipeline = [{"$match": match}]
+    if terms:
+        pipeline.append(rank_stage(terms))
+    if after:
+        pipeline.append({"$match": keyset_filter(sort_keys, decode_token(after))})
+    # One extra document tells us whether there is a next page
+    pipeline += [{"$sort": dict(sort_keys)}, {"$limit": limit + 1}]
+    # _id (and _score) stay for the next token and are dropped below
+    if fields:
+        pipeline.append({"$project": {**field_projection(fields, LOCATION_FIELDS), **{k: 1 for k, _ in sort_keys}}})
+    else:
+        pipeline.append({"$project": SEARCH_PROJECTION})
+
+    cursor = await db.locations.aggregate(pipeline)
+    locations, next_page = split_page(await cursor.to_list(), limit, sort_keys)
+    for loc in locations:
+        loc.pop("_id", None)
+        loc.pop("_score", None)
+
+    response = {"count": len(locations), "results": locations, "next": next_page}
+    if total:
+        response["total"] = await count_total(db.locations, match, total)
+    return MongoJSONResponse(response)
 
 @router.get("/{location_id}", response_model=LocationResponse)
-def get_location(location_id: str):
-    location = locations_collection.find_one({"location_id": location_id, "is_deleted": {"$ne": True}}, {"_id": 0})
+async def get_location(location_id: str, db: AsyncDatabase = Depends(get_db)):
+    location = await db.locations.find_one({"location_id": location_id, "is_deleted": False}, LOCATION_PROJECTION)
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
     return location
 
 @router.patch("/{location_id}", response_model=LocationResponse)
-def update_location(location_id: str, updates: LocationUpdate):
-    location = locations_collection.find_one({"location_id": location_id, "is_deleted": {"$ne": True}})
+async def update_location(location_id: str, updates: LocationUpdate, db: AsyncDatabase = Depends(get_db)):
+    location = await db.locations.find_one({"location_id": location_id, "is_deleted": False})
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
 
@@ -83,59 +163,23 @@ def update_location(location_id: str, updates: LocationUpdate):
         "old_data": {k: location[k] for k in update_data if k in location},
         "updated_fields": update_data
     }
-    location_history_collection.insert_one(history_entry)
+    await db.location_update_history.insert_one(history_entry)
 
     # Apply update
-    locations_collection.update_one(
+    await db.locations.update_one(
         {"location_id": location_id},
-        {"$set": update_data}
+        {"$set": {**update_data, **search_fields("locations", {**location, **update_data})}}
     )
 
-    updated = locations_collection.find_one({"location_id": location_id}, {"_id": 0})
+    updated = await db.locations.find_one({"location_id": location_id}, LOCATION_PROJECTION)
     return updated
 
 @router.delete("/{location_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_location(location_id: str):
-    result = locations_collection.update_one(
+async def delete_location(location_id: str, db: AsyncDatabase = Depends(get_db)):
+    result = await db.locations.update_one(
         {"location_id": location_id},
         {"$set": {"is_deleted": True}}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Location not found or already deleted")
     return
-
-
-
-
-
-@router.get("/filter", response_model=List[LocationResponse])
-def filter_locations(
-    user_id: Optional[str] = None,
-    city: Optional[str] = None,
-    state: Optional[str] = None,
-    country: Optional[str] = None,
-    name: Optional[str] = None,
-    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS")
-):
-    query = {"is_deleted": {"$ne": True}}
-
-    if user_id:
-        query["user_id"] = user_id
-    if city:
-        query["address.city"] = {"$regex": city, "$options": "i"}
-    if state:
-        query["address.state"] = {"$regex": state, "$options": "i"}
-    if country:
-        query["address.country"] = {"$regex": country, "$options": "i"}
-    if name:
-        query["name"] = {"$regex": name, "$options": "i"}
-    if created_from or created_to:
-        query["created_at"] = {}
-        if created_from:
-            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
-        if created_to:
-            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
-
-    locations = locations_collection.find(query, {"_id": 0})
-    return jsonable_encoder(list(locations))
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, status  # type: ignore
+from fastapi import APIRouter, Depends, HTTPException, status  # type: ignore
 from pydantic import BaseModel, EmailStr, Field  # type: ignore
 from typing import List, Optional
 from datetime import datetime, timezone
-from database.connection import get_database
+from pymongo.asynchronous.database import AsyncDatabase
+from api.dependencies import get_db
+from api.metrics import TimedRoute
 from fastapi import Query
-from fastapi.encoders import jsonable_encoder
+from api.pagination import count_total, decode_token, field_projection, keyset_filter, split_page
+from api.responses import MongoJSONResponse
 
-router = APIRouter()
-db = get_database()
-users_collection = db["users"]
-history_collection = db["user_update_history"]
+router = APIRouter(route_class=TimedRoute)
+
+# Fields the list routes' ?fields= may ask for
+USER_FIELDS = ("user_id", "email", "number", "location_ids", "created_at")
+USER_SORT = [("_id", 1)]
+DEFAULT_LIST_LIMIT = 100
+MAX_LIST_LIMIT = 1000
 
 # --------------------
 # Pydantic User Schemas
@@ -33,8 +39,8 @@ class UserUpdate(BaseModel):
 # Create a new user
 # -------------------------
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate):
-    existing = users_collection.find_one({
+async def create_user(user: UserCreate, db: AsyncDatabase = Depends(get_db)):
+    existing = await db.users.find_one({
         "$or": [{"email": user.email}, {"number": user.number}]
     })
     if existing:
@@ -43,26 +49,84 @@ def create_user(user: UserCreate):
     user_data = user.model_dump()
     user_data["created_at"] = datetime.now(timezone.utc)  # timezone-aware datetime
     user_data["is_deleted"] = False  # Soft delete flag by default
-    result = users_collection.insert_one(user_data)
+    result = await db.users.insert_one(user_data)
     user_data["id"] = str(result.inserted_id)
 
     return user_data
 
 # -------------------------
-# Get all users (excluding deleted)
+# Get all users (excluding deleted), a page at a time
+# -------------------------
+@router.get("/")
+async def get_all_users(
+    limit: int = Query(DEFAULT_LIST_LIMIT, ge=1, le=MAX_LIST_LIMIT),
+    after: Optional[str] = Query(None, description="`next` token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. user_id,email"),
+    total: Optional[str] = Query(None, pattern="^(estimate|exact)$", description="Also return a total count"),
+    db: AsyncDatabase = Depends(get_db)
+):
+    return await _user_page({"is_deleted": False}, limit, after, fields, total, db)
+
 # -------------------------
-@router.get("/", response_model=List[UserResponse])
-def get_all_users():
-    users = list(users_collection.find({"is_deleted": {"$ne": True}}, {"_id": 0}))
-    return users
+# Filter users
+# Declared before /{user_id}, which would otherwise match "filter"
+# -------------------------
+@router.get("/filter")
+async def filter_users(
+    user_id: Optional[str] = None,
+    email: Optional[str] = None,
+    number: Optional[str] = None,
+    location_id: Optional[str] = None,
+    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
+    limit: int = Query(DEFAULT_LIST_LIMIT, ge=1, le=MAX_LIST_LIMIT),
+    after: Optional[str] = Query(None, description="`next` token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. user_id,email"),
+    total: Optional[str] = Query(None, pattern="^(estimate|exact)$", description="Also return a total count"),
+    db: AsyncDatabase = Depends(get_db)
+):
+    query = {"is_deleted": False}
+
+    if user_id:
+        query["user_id"] = user_id
+    if email:
+        query["email"] = email
+    if number:
+        query["number"] = number
+    if location_id:
+        query["location_ids"] = location_id  # Checks if location_id is in the array
+
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
+        if created_to:
+            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
+
+    return await _user_page(query, limit, after, fields, total, db)
+
+async def _user_page(query, limit, after, fields, total, db):
+    """One page of users in _id order, plus the `next` token and optional total."""
+    page_query = {"$and": [query, keyset_filter(USER_SORT, decode_token(after))]} if after else query
+    # _id stays for the next token and is dropped below
+    projection = field_projection(fields, USER_FIELDS) if fields else None
+    users = await db.users.find(page_query, projection, sort=USER_SORT, limit=limit + 1).to_list()
+    users, next_page = split_page(users, limit, USER_SORT)
+    for u in users:
+        u.pop("_id", None)
+
+    response = {"count": len(users), "results": users, "next": next_page}
+    if total:
+        response["total"] = await count_total(db.users, query, total)
+    return MongoJSONResponse(response)
 
 # -------------------------
 # Get user by ID (excluding deleted)
 # -------------------------
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user_by_id(user_id: str):
-    user = users_collection.find_one(
-        {"user_id": user_id, "is_deleted": {"$ne": True}}, {"_id": 0}
+async def get_user_by_id(user_id: str, db: AsyncDatabase = Depends(get_db)):
+    user = await db.users.find_one(
+        {"user_id": user_id, "is_deleted": False}, {"_id": 0}
     )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -83,9 +147,9 @@ def get_user_by_id(user_id: str):
 # Update user (with history)
 # -------------------------
 @router.patch("/{user_id}", response_model=UserResponse)
-def update_user(user_id: str, user_update: UserUpdate):
-    existing_user = users_collection.find_one(
-        {"user_id": user_id, "is_deleted": {"$ne": True}}
+async def update_user(user_id: str, user_update: UserUpdate, db: AsyncDatabase = Depends(get_db)):
+    existing_user = await db.users.find_one(
+        {"user_id": user_id, "is_deleted": False}
     )
     if not existing_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -98,23 +162,23 @@ def update_user(user_id: str, user_update: UserUpdate):
     history_data = existing_user.copy()
     history_data["_original_id"] = history_data.pop("_id")
     history_data["modified_at"] = datetime.now(timezone.utc)
-    history_collection.insert_one(history_data)
+    await db.user_update_history.insert_one(history_data)
 
     # Update user
-    users_collection.update_one(
+    await db.users.update_one(
         {"user_id": user_id},
         {"$set": update_data}
     )
 
-    updated_user = users_collection.find_one({"user_id": user_id}, {"_id": 0})
+    updated_user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
     return updated_user
 
 # -------------------------
 # Soft delete user
 # -------------------------
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: str):
-    result = users_collection.update_one(
+async def delete_user(user_id: str, db: AsyncDatabase = Depends(get_db)):
+    result = await db.users.update_one(
         {"user_id": user_id},
         {"$set": {"is_deleted": True}}
     )
@@ -126,41 +190,11 @@ def delete_user(user_id: str):
 # Get update history for a user
 # -------------------------
 @router.get("/{user_id}/history")
-def get_user_update_history(user_id: str):
-    history = list(history_collection.find(
+async def get_user_update_history(user_id: str, db: AsyncDatabase = Depends(get_db)):
+    history = await db.user_update_history.find(
         {"user_id": user_id},
         {"_id": 0}
-    ))
+    ).to_list()
     if not history:
         raise HTTPException(status_code=404, detail="No update history found for this user")
     return history
-
-@router.get("/filter", response_model=List[UserResponse])
-def filter_users(
-    user_id: Optional[str] = None,
-    email: Optional[str] = None,
-    number: Optional[str] = None,
-    location_id: Optional[str] = None,
-    created_from: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS"),
-    created_to: Optional[str] = Query(None, description="Format: YYYY-MM-DDTHH:MM:SS")
-):
-    query = {"is_deleted": {"$ne": True}}
-
-    if user_id:
-        query["user_id"] = user_id
-    if email:
-        query["email"] = email
-    if number:
-        query["number"] = number
-    if location_id:
-        query["location_ids"] = location_id  # Checks if location_id is in the array
-
-    if created_from or created_to:
-        query["created_at"] = {}
-        if created_from:
-            query["created_at"]["$gte"] = datetime.fromisoformat(created_from)
-        if created_to:
-            query["created_at"]["$lte"] = datetime.fromisoformat(created_to)
-
-    users = list(users_collection.find(query, {"_id": 0}))
-    return jsonable_encoder(users)
@@ -0,0 +1,280 @@
+# HTTP benchmark for the hot API endpoints
+#
+# Seeds a synthetic dataset (database/setup.py), starts the API under uvicorn
+# (or uses --base-url), then drives each endpoint at a fixed concurrency and
+# records latency percentiles, throughput and the server's RSS. Results are
+# written as JSON and compared against a stored baseline.
+#
+#   python benchmarks/api_benchmark.py --seed --devices 200 --readings-per-sensor 2000
+#   python benchmarks/api_benchmark.py --save-baseline benchmarks/api_baseline.json
+#   python benchmarks/api_benchmark.py --baseline benchmarks/api_baseline.json   # exit 1 on regression
+#
+# Point MONGO_URI at a local, disposable MongoDB: --seed replaces the
+# synthetic (SYN-*) documents.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import requests
+
+from benchmarks.stats import run_metadata, summarize
+
+# Regressions smaller than this are treated as noise
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+class Endpoint:
+    def __init__(self, name: str, method: str, path: Callable[[random.Random], str],
+                 body: Optional[Callable[[random.Random], Dict[str, Any]]] = None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+
+
+def endpoints(devices: int, sensors_per_device: int) -> List[Endpoint]:
+    from database.setup import synthetic_device_id, synthetic_location_id, synthetic_sensor_id
+
+    def any_sensor(rng):
+        return synthetic_sensor_id(rng.randrange(devices), rng.randrange(sensors_per_device))
+
+    # Each request is a new reading: device time plus a per-request seq gives
+    # it its own message id, so none are skipped as retries
+    seqs = itertools.count()
+
+    def reading_body(rng):
+        d, s = rng.randrange(devices), rng.randrange(sensors_per_device)
+        return {
+            "device_id": synthetic_device_id(d),
+            "sensor_id": synthetic_sensor_id(d, s),
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "seq": next(seqs),
+            "readings": [{"sensor_name": "temperature", "status": "active",
+                          "reading": round(rng.uniform(15, 35), 2), "unit": "°C"}],
+        }
+
+    return [
+        Endpoint("sensor_data_post", "POST", lambda rng: "/sensors/sensor-data", reading_body),
+        Endpoint("last_data", "GET", lambda rng: f"/sensors/{any_sensor(rng)}/last-data"),
+        Endpoint("sensor_data_filter", "GET", lambda rng: f"/sensors/sensor-data/filter?sensor_id={any_sensor(rng)}&limit=100"),
+        Endpoint("devices_filter", "GET", lambda rng: f"/devices/filter?location_id={synthetic_location_id(rng.randrange(devices))}"),
+        Endpoint("flat_csv_export", "GET", lambda rng: f"/sensors/data/export/flat-csv/{any_sensor(rng)}"),
+    ]
+
+
+class RssSampler(threading.Thread):
+    """Samples a process's resident set size (Linux /proc) while running."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.1):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stop_event = threading.Event()
+
+    def rss_mb(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+    def run(self):
+        while self.pid and not self._stop_event.is_set():
+            rss = self.rss_mb()
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Optional[Dict[str, float]]:
+        self._stop_event.set()
+        self.join(timeout=2)
+        if not self.samples:
+            return None
+        return {"start": round(self.samples[0], 1), "peak": round(max(self.samples), 1), "end": round(self.samples[-1], 1)}
+
+
+def drive(base_url: str, endpoint: Endpoint, concurrency: int, requests_count: int, warmup: int,
+          server_pid: Optional[int], seed: int) -> Dict[str, Any]:
+    sessions = threading.local()
+    counter = iter(range(requests_count))
+    counter_lock = threading.Lock()
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    results_lock = threading.Lock()
+
+    def call(rng, record: bool):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        kwargs = {"json": endpoint.body(rng)} if endpoint.body else {}
+        started = time.perf_counter()
+        try:
+            # requests reads the whole body, so streaming exports are timed to the last byte
+            res = sessions.session.request(endpoint.method, base_url + endpoint.path(rng), timeout=60, **kwargs)
+            status = res.status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if record:
+            with results_lock:
+                latencies.append(elapsed_ms)
+                statuses[str(status)] += 1
+
+    def worker(index: int):
+        rng = random.Random(seed * 1000 + index)
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    return
+            call(rng, record=True)
+
+    warm_rng = random.Random(seed)
+    for _ in range(warmup):
+        call(warm_rng, record=False)
+
+    sampler = RssSampler(server_pid)
+    sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    seconds = time.perf_counter() - started
+    rss = sampler.stop()
+
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_counts": dict(statuses),
+        "seconds": round(seconds, 2),
+        "throughput_rps": round(len(latencies) / seconds, 1) if seconds else 0,
+        "latency_ms": summarize(latencies),
+        "server_rss_mb": rss,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Endpoints whose p95 latency rose or throughput fell by more than `tolerance`."""
+    regressions = []
+    for name, result in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        p95, base_p95 = result["latency_ms"].get("p95", 0), base["latency_ms"].get("p95", 0)
+        if base_p95 and p95 > base_p95 * (1 + tolerance) and p95 - base_p95 >= MIN_LATENCY_DELTA_MS:
+            regressions.append({"endpoint": name, "metric": "p95_ms", "baseline": base_p95, "current": p95})
+        rps, base_rps = result["throughput_rps"], base["throughput_rps"]
+        if base_rps and rps < base_rps * (1 - tolerance):
+            regressions.append({"endpoint": name, "metric": "throughput_rps", "baseline": base_rps, "current": rps})
+        if result["errors"] > base.get("errors", 0):
+            regressions.append({"endpoint": name, "metric": "errors", "baseline": base.get("errors", 0), "current": result["errors"]})
+    return regressions
+
+
+def start_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    url = f"http://127.0.0.1:{port}/"
+    for _ in range(60):
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("API server did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hot API endpoints")
+    parser.add_argument("--base-url", help="Use a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --base-url")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--seed", action="store_true", help="(Re)create the synthetic dataset first")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--sensors-per-device", type=int, default=4)
+    parser.add_argument("--readings-per-sensor", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--only", action="append", help="Endpoint name to run (repeatable)")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", default="api_benchmark.json")
+    parser.add_argument("--baseline", help="Compare against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative change before flagging")
+    parser.add_argument("--save-baseline", help="Also write the results here as the new baseline")
+    args = parser.parse_args()
+
+    if args.seed:
+        from database.setup import seed_synthetic_data
+        seed_synthetic_data(args.devices, args.sensors_per_device, args.readings_per_sensor)
+
+    server = None
+    base_url, server_pid = args.base_url, args.server_pid
+    if not base_url:
+        server = start_server(args.port)
+        base_url, server_pid = f"http://127.0.0.1:{args.port}", server.pid
+
+    results = {
+        "run": run_metadata(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline")},
+        "endpoints": {},
+    }
+    failed = []
+    try:
+        for endpoint in endpoints(args.devices, args.sensors_per_device):
+            if args.only and endpoint.name not in args.only:
+                continue
+            result = drive(base_url, endpoint, args.concurrency, args.requests, args.warmup, server_pid, args.random_seed)
+            results["endpoints"][endpoint.name] = result
+            lat = result["latency_ms"]
+            print(f"[Bench] {endpoint.name:<20} {result['throughput_rps']:>8} req/s  "
+                  f"p50 {lat.get('p50')}ms  p95 {lat.get('p95')}ms  p99 {lat.get('p99')}ms  "
+                  f"errors {result['errors']}  rss {result['server_rss_mb']}")
+            # A write that fails is not measuring the write path at all
+            if endpoint.method != "GET" and result["errors"]:
+                print(f"[Bench] ❌ {endpoint.name} returned non-2xx responses: {result['status_counts']}")
+                failed.append(endpoint.name)
+                break
+    finally:
+        if server:
+            server.terminate()
+            server.wait(10)
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"[Bench] ⚠️ Regression in {r['endpoint']}: {r['metric']} {r['baseline']} -> {r['current']}")
+
+    if failed:
+        results["failed"] = failed
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    if args.save_baseline and not failed:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+    print(f"✅ Results written to {args.output}")
+    sys.exit(1 if regressions or failed else 0)
@@ -0,0 +1,305 @@
+# Load generator for the MQTT ingest pipeline
+#
+# Simulates many devices publishing mqtt_sender payloads to a broker and
+# watches the receiver's raw archive to time every message from publish to
+# MongoDB commit. Results (config, publish counters, ingest latency
+# percentiles, sustained rate, missing messages) are written as JSON.
+#
+#   mosquitto -c mqtt_receiver/mosquitto.conf
+#   MQTT_HOST=localhost MQTT_PORT=1883 MQTT_TLS=0 python mqtt_receiver/supervisor.py --workers 4
+#   python benchmarks/mqtt_loadgen.py --devices 2000 --rate 2000 --duration 60 \
+#       --burst-every 20 --burst-seconds 5 --burst-factor 3 --output loadgen.json
+#
+# Commit times come from change stream wallTime (replica set / Atlas); on a
+# standalone mongod the archive is polled instead, which adds up to
+# --poll-interval to every latency.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paho.mqtt.client as mqtt
+from pymongo.errors import OperationFailure
+
+from benchmarks.stats import run_metadata, summarize
+from database.connection import close_client, get_database
+from database.timeseries import sensor_data_layout
+from mqtt_sender.mqtt_sender import generate_mock_data
+from services.idempotency import RAW_ARCHIVE
+
+BENCH_PREFIX = "BENCH"
+
+
+def series_ids(run_id: str, devices: int, sensors_per_device: int):
+    """(device_id, sensor_id) of every simulated sensor."""
+    return [
+        (f"{BENCH_PREFIX}-{run_id}-D{d:05d}", f"{BENCH_PREFIX}-{run_id}-D{d:05d}-S{s}")
+        for d in range(devices)
+        for s in range(sensors_per_device)
+    ]
+
+
+def build_payload(run_id: str, device_id: str, sensor_id: str, seq: int, readings: int, pad_bytes: int) -> Dict[str, Any]:
+    payload = generate_mock_data(device_id, sensor_id, seq)
+    base = payload["readings"]
+    payload["readings"] = []
+    for i in range(readings):
+        reading = dict(base[i % len(base)])
+        if i >= len(base):
+            reading["sensor_name"] = f"{reading['sensor_name']}_{i}"
+        payload["readings"].append(reading)
+    if pad_bytes and payload["readings"]:
+        payload["readings"][0]["note"] = "x" * pad_bytes
+    payload["bench_run"] = run_id
+    return payload
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class CommitWatcher(threading.Thread):
+    """Records publish-to-commit latency of every archived message of one run."""
+
+    def __init__(self, collection, run_id: str, poll_interval: float = 0.2):
+        super().__init__(name="commit-watcher", daemon=True)
+        self.collection = collection
+        self.run_id = run_id
+        self.poll_interval = poll_interval
+        self.latencies_ms: List[float] = []
+        self.first_commit = None
+        self.last_commit = None
+        self.clock = "change_stream"
+        self.ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def committed(self) -> int:
+        with self._lock:
+            return len(self.latencies_ms)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=5)
+
+    def _record(self, doc: Dict[str, Any], committed_at: datetime):
+        try:
+            published_at = _as_utc(datetime.fromisoformat(doc["ts"]))
+        except (KeyError, TypeError, ValueError):
+            return
+        committed_at = _as_utc(committed_at)
+        with self._lock:
+            self.latencies_ms.append((committed_at - published_at).total_seconds() * 1000)
+            self.first_commit = min(self.first_commit or committed_at, committed_at)
+            self.last_commit = max(self.last_commit or committed_at, committed_at)
+
+    def run(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.bench_run": self.run_id}}]
+        try:
+            with self.collection.watch(pipeline, max_await_time_ms=200) as stream:
+                self.ready.set()
+                while not self._stop_event.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        self._record(change["fullDocument"], change.get("wallTime") or datetime.now(timezone.utc))
+        except OperationFailure:
+            # Standalone servers have no change streams
+            self.clock = f"poll({self.poll_interval * 1000:.0f}ms)"
+            self._poll()
+
+    def _poll(self):
+        seen = set()
+        since = datetime.now(timezone.utc)
+        self.ready.set()
+        while not self._stop_event.is_set():
+            now = datetime.now(timezone.utc)
+            for doc in self.collection.find(
+                {"bench_run": self.run_id, "received_at": {"$gte": since}}, {"ts": 1, "received_at": 1}
+            ).sort("received_at", 1):
+                if doc["_id"] in seen:
+                    continue
+                seen.add(doc["_id"])
+                since = max(since, _as_utc(doc["received_at"]))
+                self._record(doc, now)
+            self._stop_event.wait(self.poll_interval)
+
+
+class Publisher(threading.Thread):
+    def __init__(self, index: int, series, args, run_id: str, started: float):
+        super().__init__(name=f"publisher-{index}", daemon=True)
+        self.series = series
+        self.args = args
+        self.run_id = run_id
+        self.started = started
+        self.rate = args.rate / args.publishers
+        self.published = 0
+        self.publish_errors = 0
+        self.bytes = 0
+        self.max_lag_ms = 0.0
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"loadgen-{run_id}-{index}")
+        self.client.max_inflight_messages_set(args.inflight)
+        if args.tls:
+            self.client.tls_set()
+        self.client.connect(args.host, args.port)
+        self.client.loop_start()
+
+    def current_rate(self, elapsed: float) -> float:
+        a = self.args
+        if a.burst_every and elapsed % a.burst_every < a.burst_seconds:
+            return self.rate * a.burst_factor
+        return self.rate
+
+    def run(self):
+        a = self.args
+        seq = 0
+        next_at = self.started
+        deadline = self.started + a.duration
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if next_at > now:
+                time.sleep(next_at - now)
+            else:
+                self.max_lag_ms = max(self.max_lag_ms, (now - next_at) * 1000)
+
+            device_id, sensor_id = self.series[seq % len(self.series)]
+            body = json.dumps(build_payload(self.run_id, device_id, sensor_id, seq, a.readings, a.pad_bytes))
+            info = self.client.publish(a.topic, body, qos=a.qos)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.published += 1
+                self.bytes += len(body)
+            else:
+                self.publish_errors += 1
+            seq += 1
+            next_at += 1 / self.current_rate(next_at - self.started)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def register_sensors(db, series):
+    # Known sensors, so the curated path stores them instead of rejecting
+    now = datetime.now(timezone.utc)
+    db.sensors.insert_many([
+        {"_id": sensor_id, "sensor_id": sensor_id, "devices": [device_id], "created_at": now, "is_deleted": False}
+        for device_id, sensor_id in series
+    ], ordered=False)
+
+
+def cleanup(db, run_id: str):
+    prefix = {"$regex": f"^{BENCH_PREFIX}-{run_id}-"}
+    db.sensor_data.delete_many({sensor_data_layout(db).field("sensor_id"): prefix})
+    for name in ("sensors", RAW_ARCHIVE, "sensor_rollup_1m", "sensor_rollup_1h", "sensor_rollup_1d"):
+        db[name].delete_many({"sensor_id": prefix})
+
+
+def run(args) -> Dict[str, Any]:
+    run_id = args.run_id or uuid.uuid4().hex[:8]
+    db = get_database()
+    series = series_ids(run_id, args.devices, args.sensors_per_device)
+    if args.register_sensors:
+        register_sensors(db, series)
+
+    watcher = CommitWatcher(db[RAW_ARCHIVE], run_id, args.poll_interval)
+    watcher.start()
+    watcher.ready.wait(10)
+
+    started = time.monotonic() + 1.0  # let every publisher connect first
+    publishers = [
+        Publisher(i, series[i::args.publishers] or series, args, run_id, started)
+        for i in range(args.publishers)
+    ]
+    print(f"[Loadgen] Run {run_id}: {len(series)} sensors, {args.rate} msg/s for {args.duration}s "
+          f"over {args.publishers} connections")
+    for p in publishers:
+        p.start()
+    for p in publishers:
+        p.join()
+    publish_seconds = time.monotonic() - started
+    published = sum(p.published for p in publishers)
+
+    # Drain: wait until everything is committed or progress stops
+    last_count, last_progress = -1, time.monotonic()
+    while watcher.committed < published and time.monotonic() - last_progress < args.drain_timeout:
+        if watcher.committed != last_count:
+            last_count, last_progress = watcher.committed, time.monotonic()
+        time.sleep(0.5)
+    for p in publishers:
+        p.close()
+    watcher.stop()
+
+    committed = watcher.committed
+    commit_span = (watcher.last_commit - watcher.first_commit).total_seconds() if committed > 1 else 0
+    result = {
+        "run": {**run_metadata(), "run_id": run_id},
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "run_id")},
+        "publish": {
+            "published": published,
+            "publish_errors": sum(p.publish_errors for p in publishers),
+            "seconds": round(publish_seconds, 2),
+            "offered_rate": args.rate,
+            "achieved_rate": round(published / publish_seconds, 1) if publish_seconds else 0,
+            "avg_payload_bytes": round(sum(p.bytes for p in publishers) / published, 1) if published else 0,
+            "max_schedule_lag_ms": round(max(p.max_lag_ms for p in publishers), 2),
+        },
+        "ingest": {
+            "committed": committed,
+            "missing": published - committed,
+            "drop_ratio": round((published - committed) / published, 4) if published else 0,
+            "sustained_rate": round(committed / commit_span, 1) if commit_span else 0,
+            "commit_clock": watcher.clock,
+            "latency_ms": summarize(watcher.latencies_ms),
+        },
+    }
+
+    if not args.keep_data:
+        cleanup(db, run_id)
+    close_client()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish simulated sensor traffic and measure ingest")
+    parser.add_argument("--host", default=os.getenv("MQTT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--tls", action="store_true", help="Connect with TLS (system CA bundle)")
+    parser.add_argument("--topic", default=os.getenv("MQTT_TOPIC", "mything-io"))
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--sensors-per-device", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1000, help="Messages per second, all publishers together")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of publishing")
+    parser.add_argument("--publishers", type=int, default=4, help="MQTT connections publishing in parallel")
+    parser.add_argument("--inflight", type=int, default=1000, help="Max unacknowledged QoS 1 messages per connection")
+    parser.add_argument("--readings", type=int, default=2, help="Readings per message")
+    parser.add_argument("--pad-bytes", type=int, default=0, help="Extra bytes in each message")
+    parser.add_argument("--burst-every", type=float, default=0, help="Start a burst every N seconds (0 = steady)")
+    parser.add_argument("--burst-seconds", type=float, default=0, help="Length of each burst")
+    parser.add_argument("--burst-factor", type=float, default=1, help="Rate multiplier during a burst")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="Give up waiting for commits after N idle seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="Archive poll interval without change streams")
+    parser.add_argument("--no-register-sensors", dest="register_sensors", action="store_false",
+                        help="Don't create the simulated sensors (curated writes will be rejected)")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the benchmark documents afterwards")
+    parser.add_argument("--run-id")
+    parser.add_argument("--output", help="JSON results file (default: loadgen-<run id>.json)")
+    args = parser.parse_args()
+
+    result = run(args)
+    output = args.output or f"loadgen-{result['run']['run_id']}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(json.dumps(result["publish"], indent=2))
+    print(json.dumps(result["ingest"], indent=2))
+    print(f"✅ Results written to {output}")
@@ -0,0 +1,132 @@
+# Response serialization benchmark for the filter endpoints
+#
+# Builds a page of N sensor_data documents shaped like the synthetic dataset
+# (database/setup.py) and times turning it into a response body:
+#   jsonable_encoder   the old path: the route's jsonable_encoder over the
+#                      results, then FastAPI's own pass over the returned dict
+#                      and json.dumps in JSONResponse
+#   response_model     pydantic validation of every document, then dump_json
+#                      (what a response_model=List[...] route costs)
+#   orjson             MongoJSONResponse (api/responses.py), one orjson pass
+# Both bodies are checked to decode to the same JSON first. No MongoDB needed.
+#
+#   python benchmarks/serialization_benchmark.py --documents 10000 --repeat 20
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+from api.responses import MongoJSONResponse
+from benchmarks.stats import run_metadata, summarize
+
+
+class Reading(BaseModel):
+    sensor_name: str
+    status: str
+    reading: float
+    unit: str
+    note: str
+    sensor_health: str
+    sensor_specification: str
+
+
+class SensorDataDocument(BaseModel):
+    sensor_id: str
+    device_id: str
+    created_at: datetime
+    message_id: str
+    readings: List[Reading]
+
+
+def build_page(documents: int, seed: int = 1) -> Dict[str, Any]:
+    """A /sensors/sensor-data/filter page as the route holds it before encoding."""
+    rng = random.Random(seed)
+    # Mongo hands back naive UTC datetimes
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=123000)
+    docs = []
+    for i in range(documents):
+        docs.append({
+            "sensor_id": f"SYN-SEN-{i % 400:05d}",
+            "device_id": f"SYN-DEV-{i % 100:05d}",
+            "created_at": now - timedelta(seconds=10 * i),
+            "message_id": f"{rng.getrandbits(64):016x}",
+            "readings": [
+                {"sensor_name": "temperature", "status": "active", "reading": round(rng.uniform(15, 35), 2),
+                 "unit": "°C", "note": "", "sensor_health": "good", "sensor_specification": "Synthetic"},
+                {"sensor_name": "humidity", "status": "active", "reading": round(rng.uniform(30, 80), 2),
+                 "unit": "%", "note": "", "sensor_health": "good", "sensor_specification": "Synthetic"},
+            ],
+        })
+    return {"count": len(docs), "results": docs, "next": "W3siZCI6IjIwMjYtMDEtMDFUMDA6MDA6MDAifV0"}
+
+
+def encode_jsonable(page: Dict[str, Any]) -> bytes:
+    content = {**page, "results": jsonable_encoder(page["results"])}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def encode_response_model(page: Dict[str, Any]) -> bytes:
+    adapter = TypeAdapter(List[SensorDataDocument])
+    return adapter.dump_json(adapter.validate_python(page["results"]))
+
+
+def encode_orjson(page: Dict[str, Any]) -> bytes:
+    return MongoJSONResponse(page).body
+
+
+ENCODERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    "jsonable_encoder": encode_jsonable,
+    "response_model": encode_response_model,
+    "orjson": encode_orjson,
+}
+
+
+def measure(encode: Callable[[Dict[str, Any]], bytes], page: Dict[str, Any], repeat: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        encode(page)
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(page)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"ms": summarize(latencies), "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time response encoding for a large filter page")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    page = build_page(args.documents)
+    if json.loads(encode_jsonable(page)) != json.loads(encode_orjson(page)):
+        sys.exit("❌ orjson body differs from the jsonable_encoder body")
+
+    results = {name: measure(encode, page, args.repeat, args.warmup) for name, encode in ENCODERS.items()}
+    baseline = results["jsonable_encoder"]["ms"]["p50"]
+    for name, result in results.items():
+        p50 = result["ms"]["p50"]
+        print(f"{name:>17}: p50 {p50:8.2f} ms  p95 {result['ms']['p95']:8.2f} ms  "
+              f"{result['bytes'] / 1024:8.0f} KiB  x{baseline / p50 if p50 else 0:.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": run_metadata(), "documents": args.documents, "results": results}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,106 @@
 import os
-from pymongo import MongoClient
+import threading
+from pymongo import AsyncMongoClient, MongoClient
 from dotenv import load_dotenv
 
+from database.monitoring import CommandMetrics, PoolMetrics
+from database.slow_queries import SlowQueryLog
+
 
 # Load .env from the current directory (same as this file)
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
 load_dotenv(dotenv_path)
 
-def get_database():
+# One client (and so one connection pool) per kind, per process
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+pool_metrics = {"sync": PoolMetrics(), "async": PoolMetrics()}
+command_metrics = CommandMetrics()
+# Explains and writes its records through the sync client
+slow_query_log = SlowQueryLog(lambda: get_client())
+
+
+def _get_settings():
     mongo_uri = os.getenv("MONGO_URI")
     db_name = os.getenv("MONGO_DB", "iot_project")
-   
+
     if not mongo_uri or not db_name:
         raise ValueError("MONGO_URI or MONGO_DB not found in .env file")
+    return mongo_uri, db_name
+
+
+def _client_options():
+    """Pool, timeout and compression settings, overridable from .env."""
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+        "appname": os.getenv("MONGO_APP_NAME", "aarma-be"),
+    }
+    # zlib ships with Python; snappy / zstd need python-snappy / zstandard
+    compressors = os.getenv("MONGO_COMPRESSORS", "zlib")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def get_client() -> MongoClient:
+    """Return the process-wide MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                mongo_uri, _ = _get_settings()
+                _client = MongoClient(mongo_uri, event_listeners=[pool_metrics["sync"], command_metrics, slow_query_log], **_client_options())
+    return _client
+
+
+def get_database():
+    _, db_name = _get_settings()
+    return get_client()[db_name]
+
+
+def close_client():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_async_client() -> AsyncMongoClient:
+    """Return the process-wide AsyncMongoClient, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        mongo_uri, _ = _get_settings()
+        _async_client = AsyncMongoClient(mongo_uri, event_listeners=[pool_metrics["async"], command_metrics, slow_query_log], **_client_options())
+    return _async_client
+
+
+def get_async_database():
+    _, db_name = _get_settings()
+    return get_async_client()[db_name]
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
 
-    client = MongoClient(mongo_uri)
-    return client[db_name]
 
+def get_pool_stats():
+    """Connection pool counters for every client opened by this process."""
+    options = _client_options()
+    return {
+        "max_pool_size": options["maxPoolSize"],
+        "min_pool_size": options["minPoolSize"],
+        "sync": pool_metrics["sync"].stats() if _client is not None else None,
+        "async": pool_metrics["async"].stats() if _async_client is not None else None,
+    }
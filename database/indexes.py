@@ -0,0 +1,252 @@
+# Index plan for the API's queries
+#
+# Every index a route relies on is declared in INDEXES, next to the query
+# that needs it. ensure_indexes() / ensure_indexes_async() create whatever is
+# missing and leave existing indexes on the same keys alone, so they are safe
+# to run on every API start. HOT_QUERIES are explained against the live
+# collections: a COLLSCAN there means an index is missing.
+#
+#   python database/indexes.py            # create missing indexes, then check plans
+#   python database/indexes.py --check    # only check plans (exit 1 on COLLSCAN)
+#
+# INDEX_PLAN_CHECK=strict makes the API refuse to start on a COLLSCAN
+# (default "warn" logs it, "off" skips the check).
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import OperationFailure
+
+from database.timeseries import TIMESERIES
+
+ASC, DESC = 1, -1
+# Soft-deleted documents never match a route query, so most indexes skip them.
+# Queries must say {"is_deleted": False} (not $ne: True) to use these
+NOT_DELETED = {"partialFilterExpression": {"is_deleted": False}}
+UNIQUE = {"unique": True}
+
+# collection -> [(keys, options)]
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "users": [
+        ([("user_id", ASC)], UNIQUE),
+        ([("email", ASC)], UNIQUE),
+        ([("number", ASC)], UNIQUE),
+        ([("location_ids", ASC)], NOT_DELETED),             # /users/filter?location_id
+        ([("created_at", ASC)], NOT_DELETED),               # created_from / created_to filters
+    ],
+    "locations": [
+        ([("location_id", ASC)], UNIQUE),
+        ([("user_id", ASC)], NOT_DELETED),                  # /location/filter?user_id
+        ([("created_at", ASC)], NOT_DELETED),
+        # name / city / state / country search (services/search.py)
+        ([("search.name", ASC)], NOT_DELETED),
+        ([("search.address_city", ASC)], NOT_DELETED),
+        ([("search.address_state", ASC)], NOT_DELETED),
+        ([("search.address_country", ASC)], NOT_DELETED),
+        ([("search_grams", ASC)], NOT_DELETED),
+    ],
+    "devices": [
+        # _id is the device_id
+        ([("location_id", ASC)], NOT_DELETED),              # /devices/filter?location_id
+        ([("sensors.sensor_id", ASC)], NOT_DELETED),        # multikey: devices carrying a sensor
+        ([("created_at", ASC)], NOT_DELETED),
+        # device_name / location_mark search (services/search.py)
+        ([("search.device_name", ASC)], NOT_DELETED),
+        ([("search.location_mark", ASC)], NOT_DELETED),
+        ([("search_grams", ASC)], NOT_DELETED),
+    ],
+    "sensors": [
+        # _id is the sensor_id
+        ([("sensor_id", ASC)], UNIQUE),
+    ],
+    "sensor_data": [
+        # last-data (newest first) and per-sensor pages / exports (walked
+        # backwards for created_at, _id ascending)
+        ([("sensor_id", ASC), ("created_at", DESC), ("_id", DESC)], {}),
+        ([("device_id", ASC), ("created_at", DESC), ("_id", DESC)], {}),
+        # Unfiltered pages, exports and retention
+        ([("created_at", ASC), ("_id", ASC)], {}),
+    ],
+    "user_update_history": [([("user_id", ASC), ("modified_at", DESC)], {})],
+    "location_update_history": [([("location_id", ASC), ("timestamp", DESC)], {})],
+    "device_update_history": [([("device_id", ASC), ("timestamp", DESC)], {})],
+    "sensor_update_history": [([("sensor_id", ASC), ("timestamp", DESC)], {})],
+}
+
+# A time-series sensor_data is clustered on created_at and bucketed by meta,
+# which holds sensor_id / device_id (SensorDataLayout), so it gets the plain
+# (series, time) indexes from database/timeseries.py
+TIMESERIES_SENSOR_DATA = [
+    ([(TIMESERIES.field("sensor_id"), ASC), ("created_at", DESC)], {}),
+    ([(TIMESERIES.field("device_id"), ASC), ("created_at", DESC)], {}),
+]
+
+# (collection, filter, sort): the shapes the hot routes send
+HOT_QUERIES = [
+    ("devices", {"_id": "?", "is_deleted": False}, None),
+    ("devices", {"is_deleted": False, "location_id": "?"}, None),
+    ("devices", {"is_deleted": False, "sensors": {"$elemMatch": {"sensor_id": "?"}}}, {"_id": ASC}),
+    ("sensors", {"_id": "?", "is_deleted": False}, None),
+    ("locations", {"location_id": "?", "is_deleted": False}, None),
+    ("devices", {"is_deleted": False, "search_grams": {"$all": ["device_name:?"]}}, None),
+    ("devices", {"is_deleted": False, "search.location_mark": {"$regex": "^?"}}, None),
+    ("locations", {"is_deleted": False, "user_id": "?"}, None),
+    ("locations", {"is_deleted": False, "search_grams": {"$regex": "^address_city:?"}}, None),
+    ("users", {"user_id": "?", "is_deleted": False}, None),
+    ("sensor_data", {"sensor_id": "?"}, {"created_at": DESC}),
+    ("sensor_data", {"sensor_id": "?"}, {"created_at": ASC, "_id": ASC}),
+    ("sensor_data", {"device_id": "?"}, {"created_at": ASC, "_id": ASC}),
+    ("device_update_history", {"device_id": "?"}, {"timestamp": DESC}),
+    ("user_update_history", {"user_id": "?"}, None),
+]
+# Time-series sensor_data is clustered on created_at: its time-range scans
+# are bounded collection scans by design, so these only apply to a plain one
+PLAIN_SENSOR_DATA_HOT_QUERIES = [
+    ("sensor_data", {"created_at": {"$gte": datetime(2000, 1, 1)}}, {"created_at": ASC, "_id": ASC}),
+]
+
+
+def index_plan(timeseries: bool = False) -> Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]]:
+    plan = dict(INDEXES)
+    if timeseries:
+        plan["sensor_data"] = TIMESERIES_SENSOR_DATA
+    return plan
+
+
+def hot_queries(timeseries: bool = False):
+    if not timeseries:
+        return HOT_QUERIES + PLAIN_SENSOR_DATA_HOT_QUERIES
+    # The routes name the series through meta on a time-series sensor_data
+    return [
+        (collection, TIMESERIES.query(query) if collection == "sensor_data" else query, sort)
+        for collection, query, sort in HOT_QUERIES
+    ]
+
+
+def index_name(keys: List[Tuple[str, int]]) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _options_differ(existing: Dict[str, Any], options: Dict[str, Any]) -> bool:
+    return (
+        bool(existing.get("unique")) != bool(options.get("unique"))
+        or existing.get("partialFilterExpression") != options.get("partialFilterExpression")
+    )
+
+
+def _missing(collection: str, existing: Dict[str, Dict[str, Any]], specs) -> Iterator[Tuple[list, dict]]:
+    """Declared indexes not yet present; same keys with other options are kept as they are."""
+    by_keys = {tuple(tuple(k) for k in info["key"]): info for info in existing.values()}
+    for keys, options in specs:
+        info = by_keys.get(tuple(keys))
+        if info is None:
+            yield keys, options
+        elif _options_differ(info, options):
+            print(f"[Indexes] ⚠️ {collection}.{index_name(keys)} exists with other options; keeping it")
+
+
+def ensure_indexes(db, timeseries: bool = False) -> List[str]:
+    """Create every declared index that is missing. Returns the created names."""
+    created = []
+    for collection, specs in index_plan(timeseries).items():
+        for keys, options in list(_missing(collection, db[collection].index_information(), specs)):
+            try:
+                created.append(f"{collection}.{db[collection].create_index(keys, name=index_name(keys), **options)}")
+            except OperationFailure as e:
+                # e.g. duplicates blocking a unique index: log and keep going
+                print(f"[Indexes] ❌ {collection}.{index_name(keys)}: {e}")
+    return created
+
+
+async def ensure_indexes_async(db, timeseries: bool = False) -> List[str]:
+    created = []
+    for collection, specs in index_plan(timeseries).items():
+        existing = await db[collection].index_information()
+        for keys, options in list(_missing(collection, existing, specs)):
+            try:
+                created.append(f"{collection}.{await db[collection].create_index(keys, name=index_name(keys), **options)}")
+            except OperationFailure as e:
+                print(f"[Indexes] ❌ {collection}.{index_name(keys)}: {e}")
+    return created
+
+
+def _explain_command(collection: str, query: Dict[str, Any], sort) -> Dict[str, Any]:
+    command = {"find": collection, "filter": query, "limit": 1}
+    if sort:
+        command["sort"] = sort
+    return command
+
+
+def _stages(node) -> Iterator[str]:
+    """Every plan stage in an explain document, skipping rejected plans."""
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            yield node["stage"]
+        for key, value in node.items():
+            if key != "rejectedPlans":
+                yield from _stages(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _stages(value)
+
+
+def _collscans(results) -> List[str]:
+    failures = []
+    for (collection, query, sort), explain in results:
+        if "COLLSCAN" in set(_stages(explain)):
+            failures.append(f"{collection} {query} sort={sort}")
+            print(f"[Indexes] ❌ COLLSCAN: {collection}.find({query}) sort={sort}")
+    return failures
+
+
+def check_query_plans(db, timeseries: bool = False) -> List[str]:
+    """Explain the hot queries; returns (and logs) the ones planned as COLLSCAN."""
+    results = []
+    for collection, query, sort in hot_queries(timeseries):
+        explain = db.command("explain", _explain_command(collection, query, sort), verbosity="queryPlanner")
+        results.append(((collection, query, sort), explain))
+    return _collscans(results)
+
+
+async def check_query_plans_async(db, timeseries: bool = False) -> List[str]:
+    results = []
+    for collection, query, sort in hot_queries(timeseries):
+        explain = await db.command("explain", _explain_command(collection, query, sort), verbosity="queryPlanner")
+        results.append(((collection, query, sort), explain))
+    return _collscans(results)
+
+
+async def prepare_indexes_async(db, timeseries: bool = False):
+    """API startup: create missing indexes, then check the hot query plans."""
+    created = await ensure_indexes_async(db, timeseries)
+    if created:
+        print(f"[Indexes] Created {', '.join(created)}")
+
+    mode = os.getenv("INDEX_PLAN_CHECK", "warn")
+    if mode == "off":
+        return
+    failures = await check_query_plans_async(db, timeseries)
+    if failures and mode == "strict":
+        raise RuntimeError(f"{len(failures)} hot queries would scan a whole collection: {failures}")
+
+
+if __name__ == "__main__":
+    from database.connection import get_database
+    from database.timeseries import is_timeseries
+
+    parser = argparse.ArgumentParser(description="Create the API's indexes and check hot query plans")
+    parser.add_argument("--check", action="store_true", help="Only check query plans")
+    args = parser.parse_args()
+
+    db = get_database()
+    timeseries = is_timeseries(db)
+    if not args.check:
+        created = ensure_indexes(db, timeseries)
+        print(f"✅ Created {len(created)} indexes" + (f": {', '.join(created)}" if created else ""))
+    failures = check_query_plans(db, timeseries)
+    print(f"✅ No COLLSCAN in {len(hot_queries(timeseries))} hot queries" if not failures else f"❌ {len(failures)} COLLSCANs")
+    sys.exit(1 if failures else 0)
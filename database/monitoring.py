@@ -0,0 +1,237 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+# Prometheus' default buckets, plus finer ones for sub-5ms Mongo commands
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025) + DEFAULT_BUCKETS
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """A labelled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List[float]] = {}   # labels -> bucket counts + [sum, count]
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, labels, str(bound))} {int(count)}")
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, labels, '+Inf')} {int(values[-1])}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, labels)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, labels)} {int(values[-1])}")
+        return lines
+
+
+class Counter:
+    """A labelled counter rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_str(self.labels, labels)} {value:g}")
+        return lines
+
+
+def render_prometheus(metrics) -> str:
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTiming:
+    """Time spent in Mongo while serving one API request."""
+
+    __slots__ = ("db", "handler_done", "db_at_handler_done")
+
+    def __init__(self):
+        self.db = 0.0
+        self.handler_done: Optional[float] = None
+        self.db_at_handler_done = 0.0
+
+    def mark_handler_done(self):
+        self.handler_done = time.perf_counter()
+        self.db_at_handler_done = self.db
+
+
+# Set by the API middleware; command events for that request add to it
+request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connection pool events for one MongoClient."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "pools": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "connections_open": 0,
+            "checked_out": 0,
+            "in_use": 0,
+            "max_in_use": 0,
+            "checkout_failed": 0,
+            "pool_cleared": 0,
+        }
+
+    def _inc(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def pool_created(self, event):
+        self._inc("pools")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._inc("pool_cleared")
+
+    def pool_closed(self, event):
+        self._inc("pools", -1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._counters["connections_created"] += 1
+            self._counters["connections_open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._counters["connections_closed"] += 1
+            self._counters["connections_open"] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failed")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            c = self._counters
+            c["checked_out"] += 1
+            c["in_use"] += 1
+            c["max_in_use"] = max(c["max_in_use"], c["in_use"])
+
+    def connection_checked_in(self, event):
+        self._inc("in_use", -1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-collection, per-command durations and document counts.
+
+    Command replies do not carry docsExamined (only explain and the profiler
+    do), so documents are counted as returned by cursors or reported as "n"
+    by writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections: Dict[Tuple[Any, int], str] = {}   # (connection, request id) -> collection
+        self.duration = Histogram(
+            "mongodb_command_duration_seconds", "MongoDB command round trip time",
+            ("collection", "command"), COMMAND_BUCKETS,
+        )
+        self.documents = Counter(
+            "mongodb_command_documents_total", "Documents returned or written by MongoDB commands",
+            ("collection", "command"),
+        )
+        self.failures = Counter(
+            "mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"),
+        )
+
+    @staticmethod
+    def _collection(event) -> str:
+        if event.command_name == "getMore":
+            return str(event.command.get("collection", ""))
+        target = event.command.get(event.command_name)
+        return target if isinstance(target, str) else ""
+
+    @staticmethod
+    def _documents(reply) -> int:
+        cursor = reply.get("cursor")
+        if isinstance(cursor, dict):
+            return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+        n = reply.get("n")
+        return n if isinstance(n, int) else 0
+
+    def _finish(self, event) -> Tuple[str, str]:
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        timing = request_timing.get()
+        if timing is not None:
+            timing.db += event.duration_micros / 1e6
+        labels = (collection, event.command_name)
+        self.duration.observe(labels, event.duration_micros / 1e6)
+        return labels
+
+    def started(self, event):
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def succeeded(self, event):
+        labels = self._finish(event)
+        documents = self._documents(event.reply)
+        if documents:
+            self.documents.inc(labels, documents)
+
+    def failed(self, event):
+        self.failures.inc(self._finish(event))
+
+    def metrics(self):
+        return [self.duration, self.documents, self.failures]
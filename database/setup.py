@@ -204,8 +204,19 @@
 
 # seed_dev_data.py
 
-from datetime import datetime, timezone
-from connection import get_database
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+from database.connection import get_database
+from database.indexes import ensure_indexes
+from database.timeseries import create_sensor_data_timeseries, is_timeseries, sensor_data_layout
+from services.idempotency import RAW_ARCHIVE, ensure_message_id_index, message_id
+from services.rollups import ROLLUPS, apply_rollups
+from services.search import with_search
 
 db = get_database()
 
@@ -227,7 +238,7 @@ def seed_users():
 def seed_locations():
     db.locations.replace_one(
         {"location_id": "LOC001"},
-        {
+        with_search("locations", {
             "location_id": "LOC001",
             "user_id": "USER001",
             "address": {
@@ -243,14 +254,14 @@ def seed_locations():
             "created_at": datetime.now(timezone.utc),
             "updated_at": datetime.now(timezone.utc),
             "is_deleted": False
-        },
+        }),
         upsert=True
     )
 
 def seed_devices():
     db.devices.replace_one(
         {"device_id": "DEV001"},
-        {
+        with_search("devices", {
             "device_id": "DEV001",
             "location_id": "LOC001",
             "location_mark": "Lab 1",
@@ -259,7 +270,7 @@ def seed_devices():
             "created_at": datetime.now(timezone.utc),
             "updated_at": datetime.now(timezone.utc),
             "is_deleted": False
-        },
+        }),
         upsert=True
     )
 
@@ -278,11 +289,15 @@ def seed_sensors():
     )
 
 def seed_sensor_data():
-    db.sensor_data.replace_one(
-        {
-            "sensor_id": "SENS001",
-            "created_at": datetime(2025, 6, 21, tzinfo=timezone.utc)
-        },
+    # Time-series collections don't support upserts, so insert only if missing
+    layout = sensor_data_layout(db)
+    if db.sensor_data.find_one(layout.query({
+        "sensor_id": "SENS001",
+        "created_at": datetime(2025, 6, 21, tzinfo=timezone.utc)
+    })):
+        return
+
+    db.sensor_data.insert_one(layout.document(
         {
             "sensor_id": "SENS001",
             "device_id": "DEV001",
@@ -298,9 +313,8 @@ def seed_sensor_data():
                     "sensor_specification": "DHT11"
                 }
             ]
-        },
-        upsert=True
-    )
+        }
+    ))
 
 def seed_update_history():
     now = datetime.now(timezone.utc)
@@ -372,28 +386,131 @@ def seed_update_history():
         upsert=True
     )
 
-def create_indexes():
-    db.users.create_index("user_id", unique=True)
-    db.users.create_index("email", unique=True)
-    db.users.create_index("number", unique=True)
-
-    db.locations.create_index("location_id", unique=True)
-    db.locations.create_index("user_id")
-
-    db.devices.create_index("device_id", unique=True)
-    db.devices.create_index("location_id")
+# -------------------------- Synthetic datasets --------------------------
+# Deterministic ids, so benchmarks can address the data without querying it
+
+SYNTHETIC_PREFIX = "SYN"
+SYNTHETIC_DEVICES_PER_LOCATION = 50
+
+
+def synthetic_device_id(d, prefix=SYNTHETIC_PREFIX):
+    return f"{prefix}-D{d:05d}"
+
+def synthetic_sensor_id(d, s, prefix=SYNTHETIC_PREFIX):
+    return f"{synthetic_device_id(d, prefix)}-S{s}"
+
+def synthetic_location_id(d, prefix=SYNTHETIC_PREFIX):
+    return f"{prefix}-LOC{d // SYNTHETIC_DEVICES_PER_LOCATION:04d}"
+
+
+def clear_synthetic_data(prefix=SYNTHETIC_PREFIX):
+    pattern = {"$regex": f"^{prefix}-"}
+    db.devices.delete_many({"_id": pattern})
+    db.sensors.delete_many({"_id": pattern})
+    db.sensor_data.delete_many({sensor_data_layout(db).field("sensor_id"): pattern})
+    for name in [RAW_ARCHIVE] + [collection for collection, _, _ in ROLLUPS.values()]:
+        db[name].delete_many({"sensor_id": pattern})
+
+
+def seed_synthetic_data(devices=100, sensors_per_device=4, readings_per_sensor=1000,
+                        interval_seconds=60, prefix=SYNTHETIC_PREFIX, seed=42, batch_size=5000):
+    """
+    Replace the synthetic dataset with `devices` devices, each carrying
+    `sensors_per_device` sensors with `readings_per_sensor` sensor_data
+    documents spaced `interval_seconds` apart and ending now.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    clear_synthetic_data(prefix)
+
+    device_docs, sensor_docs = [], []
+    for d in range(devices):
+        device_id = synthetic_device_id(d, prefix)
+        location_id = synthetic_location_id(d, prefix)
+        sensors = []
+        for s in range(sensors_per_device):
+            sensor_id = synthetic_sensor_id(d, s, prefix)
+            sensors.append({
+                "sensor_id": sensor_id,
+                "sensor_name": ["temperature", "humidity", "voltage", "current"][s % 4],
+                "sensor_specification": "Synthetic",
+                "location_id": location_id
+            })
+            sensor_docs.append({
+                "_id": sensor_id,
+                "sensor_id": sensor_id,
+                "devices": [device_id],
+                "created_at": now,
+                "is_deleted": False
+            })
+        device_docs.append(with_search("devices", {
+            "_id": device_id,
+            "device_id": device_id,
+            "location_id": location_id,
+            "location_mark": f"Rack {d % 20}",
+            "device_name": f"Synthetic Monitor {d}",
+            "sensors": sensors,
+            "created_at": now,
+            "is_deleted": False
+        }))
+    if device_docs:
+        db.devices.insert_many(device_docs)
+        db.sensors.insert_many(sensor_docs)
+
+    layout = sensor_data_layout(db)
+    batch, written = [], 0
+    for doc in sensor_docs:
+        device_id = doc["devices"][0]
+        for i in range(readings_per_sensor):
+            created_at = now - timedelta(seconds=interval_seconds * (readings_per_sensor - i))
+            batch.append({
+                "sensor_id": doc["_id"],
+                "device_id": device_id,
+                "created_at": created_at,
+                "message_id": message_id(device_id, doc["_id"], created_at),
+                "readings": [
+                    {"sensor_name": "temperature", "status": "active", "reading": round(rng.uniform(15, 35), 2),
+                     "unit": "°C", "note": "", "sensor_health": "good", "sensor_specification": "Synthetic"},
+                    {"sensor_name": "humidity", "status": "active", "reading": round(rng.uniform(30, 80), 2),
+                     "unit": "%", "note": "", "sensor_health": "good", "sensor_specification": "Synthetic"}
+                ]
+            })
+            if len(batch) >= batch_size:
+                db.sensor_data.insert_many([layout.document(d) for d in batch], ordered=False)
+                apply_rollups(db, batch)
+                written += len(batch)
+                batch = []
+    if batch:
+        db.sensor_data.insert_many([layout.document(d) for d in batch], ordered=False)
+        apply_rollups(db, batch)
+        written += len(batch)
+
+    print(f"✅ Synthetic data: {len(device_docs)} devices, {len(sensor_docs)} sensors, {written} sensor_data documents")
+    return {"devices": len(device_docs), "sensors": len(sensor_docs), "sensor_data": written}
 
-    db.sensors.create_index("sensor_id", unique=True)
 
-    db.sensor_data.create_index([("sensor_id", 1), ("created_at", 1)], unique=True)
+def create_indexes():
+    # The route indexes are declared in database/indexes.py
+    created = ensure_indexes(db, is_timeseries(db))
+    print(f"✅ Created {len(created)} indexes")
 
-    db.user_update_history.create_index("user_id")
-    db.device_update_history.create_index("device_id")
-    db.location_update_history.create_index("location_id")
-    db.sensor_update_history.create_index("sensor_id")
+    ensure_message_id_index(db, is_timeseries(db))
+    db[RAW_ARCHIVE].create_index([("sensor_id", 1), ("received_at", -1)])
 
 # ✅ Only run when this file is executed directly
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed development data")
+    parser.add_argument("--timeseries", action="store_true",
+                        help="Create sensor_data as a time-series collection (new databases only)")
+    parser.add_argument("--synthetic-devices", type=int, default=0,
+                        help="Also (re)create a synthetic dataset with this many devices")
+    parser.add_argument("--sensors-per-device", type=int, default=4)
+    parser.add_argument("--readings-per-sensor", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.timeseries:
+        create_sensor_data_timeseries(db)
+
     seed_users()
     seed_locations()
     seed_devices()
@@ -401,4 +518,6 @@ if __name__ == "__main__":
     seed_sensor_data()
     seed_update_history()
     create_indexes()
+    if args.synthetic_devices:
+        seed_synthetic_data(args.synthetic_devices, args.sensors_per_device, args.readings_per_sensor)
     print("✅ Seeding completed.")
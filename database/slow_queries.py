@@ -0,0 +1,255 @@
+# Slow-query log
+#
+# A CommandListener registered on every Mongo client. Any command slower than
+# SLOW_QUERY_MS is written to the `slow_queries` collection with its query
+# shape (field names and operators kept, values replaced by "?"). Reads also
+# get an explain("executionStats"), at most once per shape every
+# SLOW_QUERY_EXPLAIN_INTERVAL seconds, so the plan (COLLSCAN / IXSCAN) and
+# keys/docs examined are on record. Writes and explains happen on a
+# background thread, never on the request path.
+#
+#   SLOW_QUERY_MS=100                   # threshold, 0 disables the log
+#   SLOW_QUERY_EXPLAIN_INTERVAL=600
+#   SLOW_QUERY_RETENTION_DAYS=14
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import monitoring
+
+SLOW_QUERIES = "slow_queries"
+
+# command -> where its filter lives in the command document
+SHAPED_COMMANDS = {
+    "find": ("filter",),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("query",),
+    "findAndModify": ("query",),
+    "update": ("updates", 0, "q"),
+    "delete": ("deletes", 0, "q"),
+}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+# Driver/session fields that explain does not accept
+_SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+_SKIPPED_DATABASES = {"admin", "config", "local"}
+
+
+def threshold_ms() -> float:
+    return float(os.getenv("SLOW_QUERY_MS", "100"))
+
+
+def redact(value: Any) -> Any:
+    """Query shape: keys and operators kept, values replaced by "?". Lists of
+    values collapse to one "?" so $in lists of any length share a shape;
+    pipelines and $and / $or clauses keep every element."""
+    if isinstance(value, dict):
+        return {key: redact(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(v, (dict, list, tuple)) for v in value):
+            return [redact(v) for v in value]
+        return ["?"] if value else []
+    return "?"
+
+
+def query_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    value: Any = command
+    for step in SHAPED_COMMANDS.get(command_name, ()):
+        try:
+            value = value[step]
+        except (KeyError, IndexError, TypeError):
+            value = {}
+            break
+    shape = {"filter": redact(value)} if command_name != "aggregate" else {"pipeline": redact(value)}
+    # Sort and projection values are directions / flags, not data
+    for key in ("sort", "projection", "key"):
+        if key in command:
+            shape[key] = command[key]
+    return shape
+
+
+def shape_hash(collection: str, command_name: str, shape: Dict[str, Any]) -> str:
+    canonical = json.dumps([collection, command_name, shape], sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def _winning_stage(plan: Dict[str, Any]):
+    """Innermost stage of a winning plan (e.g. COLLSCAN or IXSCAN) and the index it used."""
+    stage = index = None
+    while isinstance(plan, dict):
+        stage = plan.get("stage", stage)
+        index = plan.get("indexName", index)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return stage, index
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    # Aggregations nest the query plan under their first $cursor stage
+    if "stages" in explain and "queryPlanner" not in explain:
+        explain = explain["stages"][0].get("$cursor", {})
+    planner = explain.get("queryPlanner", {})
+    stats = explain.get("executionStats", {})
+    stage, index = _winning_stage(planner.get("winningPlan", {}))
+    return {
+        "plan_stage": stage,
+        "index": index,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "n_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Records commands slower than the threshold into `slow_queries`."""
+
+    def __init__(self, client_factory: Callable[[], Any], max_pending: int = 1000):
+        self.client_factory = client_factory
+        self.threshold_ms = threshold_ms()
+        self.explain_interval = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+        self._commands: Dict[Any, tuple] = {}   # (connection, request id) -> (database, command)
+        self._lock = threading.Lock()
+        self._explained: Dict[str, float] = {}  # shape hash -> monotonic time of last explain
+        self._pending: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self._indexed = set()
+        self.dropped = 0
+
+    def _tracked(self, event) -> bool:
+        return (
+            self.threshold_ms > 0
+            and event.command_name in SHAPED_COMMANDS
+            and event.database_name not in _SKIPPED_DATABASES
+            and event.command.get(event.command_name) != SLOW_QUERIES
+        )
+
+    def started(self, event):
+        if self._tracked(event):
+            with self._lock:
+                self._commands[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event, error=None)
+
+    def failed(self, event):
+        self._finish(event, error=str(event.failure.get("errmsg", "")) if isinstance(event.failure, dict) else None)
+
+    def _finish(self, event, error):
+        with self._lock:
+            entry = self._commands.pop((event.connection_id, event.request_id), None)
+        if entry is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        database, command = entry
+        try:
+            self._pending.put_nowait({
+                "database": database, "command_name": event.command_name,
+                "command": command, "duration_ms": event.duration_micros / 1000, "error": error,
+            })
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._start_worker()
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            try:
+                self.record(item)
+            except Exception as e:   # keep the logger alive whatever one record does
+                print(f"[SlowQueries] ❌ Could not record slow query: {e}")
+
+    def _should_explain(self, key: str, command_name: str, command: Dict[str, Any]) -> bool:
+        if command_name not in EXPLAINABLE:
+            return False
+        # $out / $merge pipelines cannot be explained with executionStats
+        if any("$out" in stage or "$merge" in stage for stage in command.get("pipeline", [])):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(key, float("-inf")) < self.explain_interval:
+                return False
+            self._explained[key] = now
+        return True
+
+    def ensure_indexes(self, db):
+        if db.name in self._indexed:
+            return
+        days = int(os.getenv("SLOW_QUERY_RETENTION_DAYS", "14"))
+        db[SLOW_QUERIES].create_index("ts", expireAfterSeconds=days * 86400, name="ts_ttl")
+        db[SLOW_QUERIES].create_index([("shape_hash", 1), ("ts", -1)])
+        self._indexed.add(db.name)
+
+    def record(self, item: Dict[str, Any]):
+        db = self.client_factory()[item["database"]]
+        self.ensure_indexes(db)
+        command_name, command = item["command_name"], item["command"]
+        collection = command.get(command_name, "")
+        shape = query_shape(command_name, command)
+        key = shape_hash(collection, command_name, shape)
+
+        doc = {
+            "ts": datetime.now(timezone.utc),
+            "shape_hash": key,
+            "collection": collection,
+            "command": command_name,
+            # As a string: shapes are full of $-prefixed and dotted keys
+            "shape": json.dumps(shape, sort_keys=True, default=str),
+            "duration_ms": round(item["duration_ms"], 2),
+        }
+        if item["error"]:
+            doc["error"] = item["error"]
+        if self._should_explain(key, command_name, command):
+            explain_cmd = {k: v for k, v in command.items() if k not in _SESSION_FIELDS and not k.startswith("$")}
+            try:
+                doc["explain"] = summarize_explain(db.command("explain", explain_cmd, verbosity="executionStats"))
+            except Exception as e:   # still record the timing without a plan
+                doc["explain"] = {"error": str(e)}
+        db[SLOW_QUERIES].insert_one(doc)
+
+
+def slow_query_summary_pipeline(since: datetime, limit: int = 10) -> List[Dict[str, Any]]:
+    """Top query shapes by total time since `since`, with their latest plan."""
+    return [
+        {"$match": {"ts": {"$gte": since}}},
+        {"$sort": {"ts": -1}},
+        {"$group": {
+            "_id": "$shape_hash",
+            "collection": {"$first": "$collection"},
+            "command": {"$first": "$command"},
+            "shape": {"$first": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "last_seen": {"$first": "$ts"},
+            "explains": {"$push": "$explain"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "shape_hash": "$_id",
+            "collection": 1,
+            "command": 1,
+            "shape": 1,
+            "count": 1,
+            "total_ms": {"$round": ["$total_ms", 2]},
+            "avg_ms": {"$round": [{"$divide": ["$total_ms", "$count"]}, 2]},
+            "max_ms": 1,
+            "last_seen": 1,
+            # Newest explain for the shape (entries in between have none)
+            "explain": {"$first": {"$filter": {"input": "$explains", "cond": {"$ne": ["$$this", None]}}}},
+        }},
+    ]
@@ -0,0 +1,230 @@
+# Time-series layout for sensor_data
+#
+#   python database/timeseries.py --migrate            # rename, create, backfill
+#   python database/timeseries.py --migrate --resume   # continue an interrupted backfill
+#
+# A time-series collection cannot be converted in place, so the migration
+# renames the plain collection to sensor_data_legacy, creates sensor_data as a
+# time-series collection and copies the legacy documents over in batches.
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import BulkWriteError
+
+from database.connection import get_database
+
+SENSOR_DATA = "sensor_data"
+SENSOR_DATA_LEGACY = "sensor_data_legacy"
+TIME_FIELD = "created_at"
+META_FIELD = "meta"  # {"sensor_id", "device_id"}: one bucket series per sensor/device
+META_KEYS = ("sensor_id", "device_id")
+MIGRATION_ID = "sensor_data_timeseries"
+
+
+class SensorDataLayout:
+    """
+    Where sensor_data keeps sensor_id / device_id.
+
+    A plain collection has them top-level. A time-series one stores them only
+    in the metaField, and queries / indexes must name meta.sensor_id /
+    meta.device_id for MongoDB to prune buckets by series. Readers get the
+    same flat documents either way (flatten / FLATTEN_STAGES).
+    """
+
+    def __init__(self, timeseries: bool):
+        self.timeseries = timeseries
+
+    def field(self, name: str) -> str:
+        return f"{META_FIELD}.{name}" if self.timeseries and name in META_KEYS else name
+
+    def query(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """A filter written against flat documents, with its top-level keys renamed for this layout."""
+        return {self.field(key): value for key, value in query.items()}
+
+    def document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """The stored form of a flat sensor_data document (a copy)."""
+        doc = dict(doc)
+        if self.timeseries:
+            doc[META_FIELD] = {key: doc.pop(key, None) for key in META_KEYS}
+        return doc
+
+
+PLAIN = SensorDataLayout(False)
+TIMESERIES = SensorDataLayout(True)
+
+# Reads: put the meta fields back at the top. Documents written before the
+# ids moved into meta have both, with the same values
+FLATTEN_STAGES = [
+    {"$replaceWith": {"$mergeObjects": [{"$ifNull": [f"${META_FIELD}", {}]}, "$$ROOT"]}},
+    {"$unset": META_FIELD},
+]
+
+
+def flatten(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A stored sensor_data document as readers see it: ids top-level, no meta."""
+    if doc is None:
+        return None
+    meta = doc.pop(META_FIELD, None) or {}
+    return {**meta, **doc}
+
+
+def is_timeseries(db, name=SENSOR_DATA) -> bool:
+    info = next(db.list_collections(filter={"name": name}), None)
+    return bool(info and info.get("type") == "timeseries")
+
+
+async def is_timeseries_async(db, name=SENSOR_DATA) -> bool:
+    cursor = await db.list_collections(filter={"name": name})
+    info = next(iter(await cursor.to_list()), None)
+    return bool(info and info.get("type") == "timeseries")
+
+
+# database name -> layout, looked up once per process: restart API and
+# receivers after migrating
+_layouts: Dict[str, SensorDataLayout] = {}
+
+
+def sensor_data_layout(db) -> SensorDataLayout:
+    if db.name not in _layouts:
+        _layouts[db.name] = TIMESERIES if is_timeseries(db) else PLAIN
+    return _layouts[db.name]
+
+
+async def sensor_data_layout_async(db) -> SensorDataLayout:
+    if db.name not in _layouts:
+        _layouts[db.name] = TIMESERIES if await is_timeseries_async(db) else PLAIN
+    return _layouts[db.name]
+
+
+def create_sensor_data_timeseries(db, name=SENSOR_DATA, granularity="minutes", expire_after_seconds=None):
+    """Create `name` as a time-series collection (no-op if it already is one)."""
+    if is_timeseries(db, name):
+        return db[name]
+    if name in db.list_collection_names():
+        raise RuntimeError(f"'{name}' already exists as a plain collection; run the migration instead")
+
+    options = {
+        "timeseries": {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": granularity}
+    }
+    if expire_after_seconds:
+        options["expireAfterSeconds"] = expire_after_seconds
+    collection = db.create_collection(name, **options)
+
+    # Series lookups go through the metaField (SensorDataLayout)
+    collection.create_index([(TIMESERIES.field("sensor_id"), 1), (TIME_FIELD, -1)])
+    collection.create_index([(TIMESERIES.field("device_id"), 1), (TIME_FIELD, -1)])
+    # message_id can't be unique here; writes claim it in services.idempotency.MESSAGE_IDS
+    return collection
+
+
+def _coerce_time(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    return None
+
+
+def backfill(db, batch_size=5000, resume=True):
+    """
+    Copy sensor_data_legacy into the time-series sensor_data in `_id` order.
+
+    Progress is checkpointed in the `migrations` collection after every
+    batch, so an interrupted run can pick up where it stopped.
+    """
+    legacy = db[SENSOR_DATA_LEGACY]
+    target = db[SENSOR_DATA]
+    progress = db.migrations.find_one({"_id": MIGRATION_ID}) if resume else None
+    last_id = progress.get("last_id") if progress else None
+    copied = progress.get("copied", 0) if progress else 0
+    skipped = progress.get("skipped", 0) if progress else 0
+    started = time.monotonic()
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(legacy.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        docs = []
+        for doc in batch:
+            created_at = _coerce_time(doc.get(TIME_FIELD))
+            if created_at is None:
+                skipped += 1
+                continue
+            doc[TIME_FIELD] = created_at
+            docs.append(TIMESERIES.document(doc))
+
+        if docs:
+            try:
+                target.insert_many(docs, ordered=False)
+                copied += len(docs)
+            except BulkWriteError as e:
+                copied += e.details.get("nInserted", 0)
+                skipped += len(e.details.get("writeErrors", []))
+
+        last_id = batch[-1]["_id"]
+        db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "copied": copied, "skipped": skipped,
+                      "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        rate = copied / max(time.monotonic() - started, 1e-6)
+        print(f"[Timeseries] Copied {copied} documents ({skipped} skipped, {rate:.0f} docs/s)")
+
+    return {"copied": copied, "skipped": skipped}
+
+
+def migrate(db, batch_size=5000, granularity="minutes", resume=False, drop_legacy=False):
+    """Rename the plain sensor_data, create the time-series one and backfill it."""
+    names = db.list_collection_names()
+    if SENSOR_DATA in names and not is_timeseries(db):
+        if SENSOR_DATA_LEGACY in names:
+            raise RuntimeError(f"Both '{SENSOR_DATA}' and '{SENSOR_DATA_LEGACY}' exist; resolve manually")
+        db[SENSOR_DATA].rename(SENSOR_DATA_LEGACY)
+        print(f"[Timeseries] Renamed '{SENSOR_DATA}' to '{SENSOR_DATA_LEGACY}'")
+        resume = False
+
+    create_sensor_data_timeseries(db, granularity=granularity)
+
+    result = {"copied": 0, "skipped": 0}
+    if SENSOR_DATA_LEGACY in db.list_collection_names():
+        result = backfill(db, batch_size=batch_size, resume=resume)
+        if drop_legacy:
+            db[SENSOR_DATA_LEGACY].drop()
+            print(f"[Timeseries] Dropped '{SENSOR_DATA_LEGACY}'")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move sensor_data to a time-series collection")
+    parser.add_argument("--migrate", action="store_true", help="Rename, create and backfill sensor_data")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted backfill")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--granularity", choices=["seconds", "minutes", "hours"], default="minutes")
+    parser.add_argument("--drop-legacy", action="store_true", help="Drop sensor_data_legacy after the copy")
+    args = parser.parse_args()
+
+    if not args.migrate:
+        parser.print_help()
+        sys.exit(1)
+
+    summary = migrate(
+        get_database(),
+        batch_size=args.batch_size,
+        granularity=args.granularity,
+        resume=args.resume,
+        drop_legacy=args.drop_legacy,
+    )
+    print("✅ Migration completed:", summary)
@@ -0,0 +1,193 @@
+# === async_receiver.py ===
+#
+#   python mqtt_receiver/async_receiver.py
+#   python mqtt_receiver/supervisor.py --workers 4 --mode async
+#
+# asyncio variant of mqtt_receiver.py (same MQTT_* settings, always stores in process).
+# Messages are routed by crc32(sensor_id) into one of MQTT_ASYNC_CONSUMERS
+# bounded sub-queues, each drained by its own task: readings of one sensor
+# are handled in arrival order, different sensors in parallel, and all
+# MongoDB I/O goes through the async client.
+import asyncio
+import json
+import os
+import signal
+import ssl
+import sys
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+# First on the path, so `mqtt_receiver` is the package and not mqtt_receiver.py next to this file
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiomqtt
+
+from database.connection import close_async_client, close_client, get_async_database, get_database
+from database.timeseries import sensor_data_layout
+from mqtt_receiver.mqtt_receiver import (
+    CA_PATH, CERT_PATH, ENDPOINT, KEY_PATH, PORT, QOS, USE_TLS,
+    raw_document, sensor_partition, service_payload, subscription_topic, worker_client_id,
+)
+from services.idempotency import RAW_ARCHIVE, StoreError, ensure_message_id_index, store_new_async
+from services.reading_cache import ensure_last_readings_index
+from services.service_layer import add_sensor_data_if_changed_batch_async, deadband, last_readings, warm_last_readings
+
+ASYNC_CONSUMERS = int(os.getenv("MQTT_ASYNC_CONSUMERS", "8"))
+ASYNC_QUEUE_SIZE = int(os.getenv("MQTT_ASYNC_QUEUE_SIZE", "1000"))    # per consumer
+ASYNC_BATCH_SIZE = int(os.getenv("MQTT_ASYNC_BATCH_SIZE", "100"))     # raw archive insert batch
+RECONNECT_DELAY = float(os.getenv("MQTT_RECONNECT_DELAY", "5"))
+
+
+class KeyedConsumers:
+    def __init__(
+        self,
+        handler: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+        consumers: int = 8,
+        max_size: int = 1000,
+        batch_size: int = 100,
+    ):
+        """
+        asyncio.Queue per consumer task, chosen by hashing the message key.
+
+        A key always maps to the same sub-queue, so its items are handled
+        one batch at a time in order; other keys proceed concurrently on
+        the other tasks. A full sub-queue makes put() wait (backpressure).
+
+        Args:
+            handler (callable): Awaited with each batch of items, in queue order.
+            consumers (int): Number of sub-queues / consumer tasks.
+            max_size (int): Capacity of each sub-queue.
+            batch_size (int): Most items handed to `handler` at once.
+        """
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queues = [asyncio.Queue(maxsize=max_size) for _ in range(consumers)]
+        self.tasks: List[asyncio.Task] = []
+        self._counters = {"enqueued": 0, "handled": 0, "handler_errors": 0}
+
+    def shard(self, key: str) -> int:
+        return sensor_partition(key, len(self.queues))
+
+    async def put(self, key: str, item: Dict[str, Any]):
+        await self.queues[self.shard(key)].put(item)
+        self._counters["enqueued"] += 1
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._consume(q), name=f"consumer-{i}") for i, q in enumerate(self.queues)]
+
+    async def stop(self):
+        """Wait for everything already queued to be handled, then stop the tasks."""
+        await asyncio.gather(*(q.join() for q in self.queues))
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        depths = [q.qsize() for q in self.queues]
+        return {**self._counters, "queue_depth": sum(depths), "max_subqueue_depth": max(depths, default=0)}
+
+    async def _consume(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self.handler(batch)
+                self._counters["handled"] += len(batch)
+            except Exception as e:
+                self._counters["handler_errors"] += 1
+                print("[Async Receiver] Handler failed:", e)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+def make_handler(db):
+    raw_archive = db[RAW_ARCHIVE]
+
+    async def handle(batch: List[Dict[str, Any]]):
+        # Redeliveries stop at the raw archive's unique _id
+        try:
+            new = await store_new_async(raw_archive, batch, "_id")
+        except StoreError as e:
+            print("[Async Receiver] Raw archive write failed:", e)
+            new = e.stored
+        if not new:
+            return
+        await deadband.refresh_async(db.sensors, (doc["sensor_id"] for doc in new))
+        for result in await add_sensor_data_if_changed_batch_async(db, [service_payload(doc) for doc in new]):
+            if "error" in result:
+                print("[Service Layer] Result:", result)
+
+    return handle
+
+
+def tls_context():
+    if not USE_TLS:
+        return None
+    context = ssl.create_default_context(cafile=CA_PATH)
+    context.load_cert_chain(CERT_PATH, KEY_PATH)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+
+async def receive(consumers: KeyedConsumers, worker_id: int):
+    """Subscribe and feed the consumers, reconnecting until cancelled."""
+    while True:
+        try:
+            async with aiomqtt.Client(
+                ENDPOINT,
+                PORT,
+                identifier=worker_client_id(worker_id),
+                protocol=aiomqtt.ProtocolVersion.V5,
+                tls_context=tls_context(),
+            ) as client:
+                await client.subscribe(subscription_topic(), qos=QOS)
+                print(f"[Async Receiver {worker_id}] Connected, subscribed to {subscription_topic()}")
+                async for message in client.messages:
+                    try:
+                        doc = raw_document(json.loads(message.payload), datetime.now(timezone.utc))
+                    except (ValueError, TypeError, AttributeError) as e:
+                        print("[Async Receiver] Error:", e)
+                        continue
+                    await consumers.put(doc["sensor_id"], doc)
+        except aiomqtt.MqttError as e:
+            print(f"[Async Receiver {worker_id}] Connection lost ({e}), retrying in {RECONNECT_DELAY:.0f}s")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def run(worker_id: int = 0):
+    # Warm once with the sync client, before the event loop gets busy
+    sync_db = get_database()
+    warm_last_readings(sync_db["sensor_data"])
+    ensure_message_id_index(sync_db, sensor_data_layout(sync_db).timeseries)
+    ensure_last_readings_index(sync_db)
+    close_client()
+
+    db = get_async_database()
+    consumers = KeyedConsumers(
+        make_handler(db),
+        consumers=ASYNC_CONSUMERS,
+        max_size=ASYNC_QUEUE_SIZE,
+        batch_size=ASYNC_BATCH_SIZE,
+    )
+    consumers.start()
+
+    receiver = asyncio.create_task(receive(consumers, worker_id))
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, receiver.cancel)
+
+    try:
+        await receiver
+    except asyncio.CancelledError:
+        print("\n[Async Receiver] Stopping...")
+    finally:
+        await consumers.stop()
+        print("[Async Receiver] Final consumer stats:", consumers.stats())
+        print("[Async Receiver] Last-readings cache stats:", last_readings.stats())
+        print("[Async Receiver] Deadband stats:", deadband.stats())
+        await close_async_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(os.getenv("MQTT_WORKER_ID", "0"))))
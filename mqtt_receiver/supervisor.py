@@ -0,0 +1,131 @@
+# === supervisor.py ===
+#
+# Keeps N mqtt_receiver workers running, one process each. Workers share the
+# $share/<group>/<topic> subscription, so the broker spreads messages over
+# whichever workers are connected; a crashed worker is restarted with backoff
+# and its share moves to the others until it is back.
+#
+#   python mqtt_receiver/supervisor.py --workers 4
+#   python mqtt_receiver/supervisor.py --workers 4 --mode async   # asyncio workers
+#   kill -USR1 <supervisor pid>     # add a worker
+#   kill -USR2 <supervisor pid>     # remove a worker
+#
+# Local test against mosquitto (2.x supports MQTT 5 shared subscriptions):
+#   mosquitto -c mqtt_receiver/mosquitto.conf
+#   MQTT_HOST=localhost MQTT_PORT=1883 MQTT_TLS=0 python mqtt_receiver/supervisor.py --workers 4
+#   mosquitto_pub -h localhost -V mqttv5 -t mything-io -m '{"sensor_id": "SENS001", "device_id": "DEV001", "seq": 1, "readings": []}'
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+RECEIVERS = {
+    "thread": os.path.join(os.path.dirname(os.path.abspath(__file__)), "mqtt_receiver.py"),
+    "async": os.path.join(os.path.dirname(os.path.abspath(__file__)), "async_receiver.py"),
+}
+
+# Restart backoff: doubles per crash, reset once a worker stays up
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+STABLE_AFTER = 60.0
+STOP_TIMEOUT = 15.0
+
+
+class Supervisor:
+    def __init__(self, workers: int, mode: str = "thread"):
+        self.receiver = RECEIVERS[mode]
+        self.target = workers
+        self.procs = {}          # worker id -> Popen
+        self.started_at = {}     # worker id -> monotonic start time
+        self.backoff = {}        # worker id -> current restart delay
+        self.restart_at = {}     # worker id -> monotonic time of next start
+        self.restarts = 0
+        self.running = True
+
+    def start_worker(self, worker_id: int):
+        env = dict(os.environ, MQTT_WORKER_ID=str(worker_id))
+        self.procs[worker_id] = subprocess.Popen([sys.executable, self.receiver], env=env)
+        self.started_at[worker_id] = time.monotonic()
+        print(f"[Supervisor] Started worker {worker_id} (pid {self.procs[worker_id].pid})")
+
+    def stop_worker(self, worker_id: int):
+        proc = self.procs.pop(worker_id, None)
+        self.restart_at.pop(worker_id, None)
+        self.backoff.pop(worker_id, None)
+        if proc is None or proc.poll() is not None:
+            return
+        # SIGTERM lets the worker flush its ingest queue first
+        proc.terminate()
+        try:
+            proc.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        print(f"[Supervisor] Stopped worker {worker_id}")
+
+    def scale(self, delta: int):
+        self.target = max(1, self.target + delta)
+        print(f"[Supervisor] Scaling to {self.target} workers")
+
+    def check(self):
+        now = time.monotonic()
+
+        # Crashed workers: schedule a restart with backoff
+        for worker_id, proc in list(self.procs.items()):
+            if proc.poll() is None:
+                if now - self.started_at[worker_id] >= STABLE_AFTER:
+                    self.backoff.pop(worker_id, None)
+                continue
+            del self.procs[worker_id]
+            delay = self.backoff.get(worker_id, MIN_BACKOFF / 2) * 2
+            self.backoff[worker_id] = min(delay, MAX_BACKOFF)
+            self.restart_at[worker_id] = now + self.backoff[worker_id]
+            print(f"[Supervisor] Worker {worker_id} exited with {proc.returncode}, "
+                  f"restarting in {self.backoff[worker_id]:.0f}s")
+
+        # Scale down: highest ids first
+        for worker_id in sorted(set(self.procs) | set(self.restart_at), reverse=True):
+            if worker_id < self.target:
+                break
+            self.stop_worker(worker_id)
+
+        # Scale up and due restarts
+        for worker_id in range(self.target):
+            if worker_id in self.procs:
+                continue
+            due = self.restart_at.get(worker_id, 0)
+            if now >= due:
+                if worker_id in self.restart_at:
+                    self.restarts += 1
+                    del self.restart_at[worker_id]
+                self.start_worker(worker_id)
+
+    def stop(self, *_):
+        self.running = False
+
+    def run(self, interval: float = 1.0):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, lambda *_: self.scale(1))
+        signal.signal(signal.SIGUSR2, lambda *_: self.scale(-1))
+
+        print(f"[Supervisor] Running {self.target} workers (pid {os.getpid()})")
+        while self.running:
+            self.check()
+            time.sleep(interval)
+
+        for worker_id in list(self.procs):
+            self.stop_worker(worker_id)
+        print(f"[Supervisor] Stopped ({self.restarts} restarts)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several MQTT receiver workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=list(RECEIVERS), default="thread", help="Worker implementation")
+    parser.add_argument("--interval", type=float, default=1.0, help="Health check interval (seconds)")
+    args = parser.parse_args()
+
+    Supervisor(args.workers, args.mode).run(args.interval)
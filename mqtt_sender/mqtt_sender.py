@@ -1,14 +1,17 @@
 import json
+import os
 import ssl
 import time
 import random
+import itertools
+from datetime import datetime, timezone
 import paho.mqtt.client as mqtt
-import requests
 
 # === MQTT CONFIG ===
-ENDPOINT = "d002332310q6wvd4iri8x-ats.iot.ap-south-1.amazonaws.com"
-PORT = 8883
-TOPIC = "iot/adc_data"
+ENDPOINT = os.getenv("MQTT_HOST", "d002332310q6wvd4iri8x-ats.iot.ap-south-1.amazonaws.com")
+PORT = int(os.getenv("MQTT_PORT", "8883"))
+TOPIC = os.getenv("MQTT_TOPIC", "iot/adc_data")
+USE_TLS = os.getenv("MQTT_TLS", "1") != "0"     # MQTT_TLS=0 for a local mosquitto
 CLIENT_ID = "mqtt_sender"
 
 # === Certificate Paths ===
@@ -17,40 +20,47 @@ CA_PATH   = "../certs/AmazonRootCA1.pem"
 CERT_PATH = "../certs/8805dbe759dbb5b938494f05b7c2712546d9ef678ba719f4cf40f330b4d290de-certificate.pem.crt"
 KEY_PATH  = "../certs/8805dbe759dbb5b938494f05b7c2712546d9ef678ba719f4cf40f330b4d290de-private.pem.key"
 
-# === Local API Endpoint (that saves to MongoDB) ===
-SERVICE_URL = "http://127.0.0.1:5000/sensors/sensor-data"
-
 # === IDs for device/sensor ===
 DEVICE_ID = "DEV001"
 SENSOR_ID = "SENS001"
 
-# === Connect & Authenticate ===
-client = mqtt.Client(client_id=CLIENT_ID)
-client.tls_set(
-    ca_certs=CA_PATH,
-    certfile=CERT_PATH,
-    keyfile=KEY_PATH,
-    tls_version=ssl.PROTOCOL_TLSv1_2
-)
-
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("[✅ MQTT Sender] Connected to AWS IoT Core.")
+def on_connect(client, userdata, flags, reason_code, properties):
+    if reason_code.is_failure:
+        print(f"[❌ MQTT Sender] Connection failed: {reason_code}")
     else:
-        print(f"[❌ MQTT Sender] Connection failed with code {rc}")
-
-client.on_connect = on_connect
-print("[🔄 MQTT Sender] Connecting...")
-client.connect(ENDPOINT, PORT)
-client.loop_start()
+        print("[✅ MQTT Sender] Connected to AWS IoT Core.")
 
 
-# === Function to Generate Mock Sensor Data and Send to API ===
-def generate_mock_data():
+# === Connect & Authenticate ===
+def create_client(client_id=CLIENT_ID):
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    if USE_TLS:
+        client.tls_set(
+            ca_certs=CA_PATH,
+            certfile=CERT_PATH,
+            keyfile=KEY_PATH,
+            tls_version=ssl.PROTOCOL_TLSv1_2
+        )
+    client.on_connect = on_connect
+    print("[🔄 MQTT Sender] Connecting...")
+    client.connect(ENDPOINT, PORT)
+    client.loop_start()
+    return client
+
+
+# Per-run message counter; with the device timestamp it makes the message id
+# deterministic, so a redelivered message is stored only once
+sequence = itertools.count(1)
+
+
+# === Function to Generate Mock Sensor Data ===
+def generate_mock_data(device_id=DEVICE_ID, sensor_id=SENSOR_ID, seq=None):
     return {
-        "sensor_id": SENSOR_ID,
-        "device_id": DEVICE_ID,
+        "sensor_id": sensor_id,
+        "device_id": device_id,
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "seq": next(sequence) if seq is None else seq,
         "readings": [
             {
                 "sensor_name": "temperature",
@@ -73,30 +83,28 @@ def generate_mock_data():
         ]
     }
 
-# === Loop to Send via MQTT + API ===
-try:
-    while True:
-        mock_data = generate_mock_data()
-        payload = json.dumps(mock_data)
-
-        # Send via MQTT
-        result = client.publish(TOPIC, payload)
-        if result[0] == 0:
-            print(f"[📤 MQTT Sent] {payload}")
-        else:
-            print("[⚠️ MQTT Failed] Could not send message")
-
-        # Also send to local API (which stores in MongoDB)
-        try:
-            api_response = requests.post(SERVICE_URL, json=mock_data)
-            print(f"[🌐 API Sent] Status: {api_response.status_code}")
-        except Exception as api_err:
-            print(f"[❌ API Error] {api_err}")
-
-        time.sleep(5)
-
-except KeyboardInterrupt:
-    print("\n[🔌 MQTT Sender] Disconnected by user.")
-finally:
-    client.loop_stop()
-    client.disconnect()
+
+# === Loop to Send via MQTT ===
+# The receiver archives each message and forwards it to the API, so the
+# sender no longer posts to the API itself (that stored every reading twice)
+if __name__ == "__main__":
+    client = create_client()
+    try:
+        while True:
+            mock_data = generate_mock_data()
+            payload = json.dumps(mock_data)
+
+            # Send via MQTT
+            result = client.publish(TOPIC, payload)
+            if result[0] == 0:
+                print(f"[📤 MQTT Sent] {payload}")
+            else:
+                print("[⚠️ MQTT Failed] Could not send message")
+
+            time.sleep(5)
+
+    except KeyboardInterrupt:
+        print("\n[🔌 MQTT Sender] Disconnected by user.")
+    finally:
+        client.loop_stop()
+        client.disconnect()
@@ -0,0 +1,175 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+# Used when a sensor has no deadband metadata: store any change in value,
+# and re-store an unchanged value at least every 5 minutes as a heartbeat
+DEFAULT_DEADBAND = {"absolute": 0.0, "percent": 0.0, "max_silence": 300}
+
+# Reasons a reading is stored (or not)
+REASON_FIRST = "first"
+REASON_HEARTBEAT = "heartbeat"
+REASON_CHANGED = "changed"
+REASON_SUPPRESSED = "suppressed"
+
+
+def _as_utc(value: datetime) -> datetime:
+    # pymongo returns naive datetimes (in UTC) unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def is_significant_change(new: float, old: float, config: Dict[str, Any]) -> bool:
+    """
+    True if `new` is outside the deadband around `old`.
+
+    The change has to clear both the absolute band and the percentage band
+    (percent of the old value); a band of 0 is cleared by any change.
+    """
+    delta = abs(new - old)
+    if delta <= (config.get("absolute") or 0.0):
+        return False
+    if delta <= abs(old) * (config.get("percent") or 0.0) / 100:
+        return False
+    return True
+
+
+class DeadbandEngine:
+    def __init__(self, sensors_collection=None, refresh_interval: float = 60):
+        """
+        Decides which readings are worth storing, per sensor_id and sensor_name.
+
+        Thresholds come from the optional `deadband` field of the sensor's
+        document in the `sensors` collection:
+
+            "deadband": {
+                "by_name": {"temperature": {"absolute": 0.5, "max_silence": 600}},
+                "by_unit": {"%": {"percent": 2}},
+                "default": {"absolute": 0.1}
+            }
+
+        Lookup order is by_name, then by_unit, then default, then DEFAULT_DEADBAND.
+
+        Args:
+            sensors_collection: pymongo `sensors` collection, or None to use defaults
+                (and whatever refresh_async() loaded).
+            refresh_interval (float): Seconds before a sensor's metadata is re-read.
+        """
+        self.sensors_collection = sensors_collection
+        self.refresh_interval = refresh_interval
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "evaluated": 0,
+            REASON_FIRST: 0,
+            REASON_CHANGED: 0,
+            REASON_HEARTBEAT: 0,
+            REASON_SUPPRESSED: 0,
+        }
+
+    def _sensor_deadband(self, sensor_id: str) -> Dict[str, Any]:
+        if self.sensors_collection is None:
+            with self._lock:
+                return self._configs.get(sensor_id, {})
+        now = time.monotonic()
+        with self._lock:
+            if now - self._loaded_at.get(sensor_id, float("-inf")) < self.refresh_interval:
+                return self._configs.get(sensor_id, {})
+        try:
+            sensor = self.sensors_collection.find_one({"_id": sensor_id}, {"deadband": 1})
+        except Exception as e:
+            print(f"[Deadband] Failed to load metadata for {sensor_id}:", e)
+            sensor = None
+        config = (sensor or {}).get("deadband") or {}
+        with self._lock:
+            self._configs[sensor_id] = config
+            self._loaded_at[sensor_id] = now
+        return config
+
+    async def refresh_async(self, sensors_collection, sensor_ids: Iterable[str]):
+        """
+        Load stale metadata for `sensor_ids` in one query through an async
+        collection, so evaluate() never blocks an event loop on MongoDB.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                sensor_id for sensor_id in set(sensor_ids)
+                if now - self._loaded_at.get(sensor_id, float("-inf")) >= self.refresh_interval
+            ]
+        if not stale:
+            return
+        try:
+            found = {
+                doc["_id"]: doc.get("deadband") or {}
+                async for doc in sensors_collection.find({"_id": {"$in": stale}}, {"deadband": 1})
+            }
+        except Exception as e:
+            print("[Deadband] Failed to load metadata:", e)
+            return
+        with self._lock:
+            for sensor_id in stale:
+                self._configs[sensor_id] = found.get(sensor_id, {})
+                self._loaded_at[sensor_id] = now
+
+    def config_for(self, sensor_id: str, sensor_name: str, unit: Optional[str] = None) -> Dict[str, Any]:
+        deadband = self._sensor_deadband(sensor_id)
+        override = (
+            deadband.get("by_name", {}).get(sensor_name)
+            or (unit and deadband.get("by_unit", {}).get(unit))
+            or deadband.get("default")
+            or {}
+        )
+        return {**DEFAULT_DEADBAND, **{k: v for k, v in override.items() if v is not None}}
+
+    def evaluate(self, sensor_id: str, reading: Dict[str, Any], last: Optional[Dict[str, Any]]) -> str:
+        """
+        Classify a reading against the last stored one.
+
+        Args:
+            sensor_id (str): Sensor the reading belongs to.
+            reading (dict): Incoming reading (sensor_name, reading, unit, ...).
+            last (dict, optional): {"reading", "created_at"} of the last stored reading.
+
+        Returns:
+            str: One of "first", "changed", "heartbeat" or "suppressed".
+        """
+        if last is None:
+            reason = REASON_FIRST
+        else:
+            config = self.config_for(sensor_id, reading["sensor_name"], reading.get("unit"))
+            max_silence = config.get("max_silence")
+            silence = None
+            if last.get("created_at"):
+                silence = (datetime.now(timezone.utc) - _as_utc(last["created_at"])).total_seconds()
+
+            if is_significant_change(reading["reading"], last["reading"], config):
+                reason = REASON_CHANGED
+            elif max_silence is not None and silence is not None and silence >= max_silence:
+                reason = REASON_HEARTBEAT
+            else:
+                reason = REASON_SUPPRESSED
+
+        with self._lock:
+            self._counters["evaluated"] += 1
+            self._counters[reason] += 1
+        return reason
+
+    def should_store(self, sensor_id: str, reading: Dict[str, Any], last: Optional[Dict[str, Any]]) -> bool:
+        return self.evaluate(sensor_id, reading, last) != REASON_SUPPRESSED
+
+    def invalidate(self, sensor_id: Optional[str] = None):
+        """Force metadata to be re-read for one sensor, or all sensors."""
+        with self._lock:
+            if sensor_id is None:
+                self._loaded_at.clear()
+            else:
+                self._loaded_at.pop(sensor_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        evaluated = stats["evaluated"]
+        stats["suppression_ratio"] = round(stats[REASON_SUPPRESSED] / evaluated, 4) if evaluated else 0.0
+        return stats
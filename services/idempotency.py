@@ -0,0 +1,209 @@
+# Idempotent ingestion
+#
+# Every MQTT message gets one deterministic message id. The receiver inserts
+# the untouched payload into the raw archive (sensor_data_raw, _id = message
+# id); the API inserts the curated, deadband-filtered reading into
+# sensor_data under a unique message_id. A redelivered message or a retried
+# POST therefore hits a duplicate key and is skipped instead of adding a copy.
+# A time-series sensor_data can't enforce that, so its message ids are
+# claimed in sensor_data_message_ids first (store_new(..., claims=...)).
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+RAW_ARCHIVE = "sensor_data_raw"
+MESSAGE_ID_FIELD = "message_id"
+DUPLICATE_KEY = 11000
+# Message ids already stored in a time-series sensor_data, which can't
+# have a unique index (_id = message id)
+MESSAGE_IDS = "sensor_data_message_ids"
+MESSAGE_ID_TTL_DAYS = int(os.getenv("MESSAGE_ID_TTL_DAYS", "30"))
+
+# Payload keys a device may use for the time it took the reading
+DEVICE_TIME_FIELDS = ("ts", "timestamp", "created_at")
+
+
+def message_id(device_id: Any, sensor_id: Any, timestamp: Any, seq: Any = None) -> str:
+    """Stable id for (device, sensor, device timestamp, sequence number)."""
+    if isinstance(timestamp, datetime):
+        aware = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+        timestamp = aware.astimezone(timezone.utc).isoformat()
+    key = "|".join("" if part is None else str(part) for part in (device_id, sensor_id, timestamp, seq))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def parse_time(value: Any) -> Optional[datetime]:
+    """An aware UTC datetime from a datetime or ISO 8601 string; None if it is neither."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def device_time(payload: Dict[str, Any]) -> Optional[datetime]:
+    """When the device took the reading, from the first of DEVICE_TIME_FIELDS that parses."""
+    for field in DEVICE_TIME_FIELDS:
+        parsed = parse_time(payload.get(field))
+        if parsed:
+            return parsed
+    return None
+
+
+def payload_message_id(payload: Dict[str, Any]) -> str:
+    """
+    The message id carried by a device payload, or one derived from it.
+
+    Payloads with a device timestamp and/or `seq` get the id the API
+    derives for the same reading. Without either, the payload content
+    stands in: a redelivery carries the same bytes, the receive time would not.
+    """
+    if payload.get(MESSAGE_ID_FIELD):
+        return str(payload[MESSAGE_ID_FIELD])
+    taken_at = device_time(payload)
+    seq = payload.get("seq")
+    if taken_at is None and seq is None:
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return message_id(payload.get("device_id"), payload.get("sensor_id"), taken_at, seq)
+
+
+def first_by_key(docs: Iterable[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    """Drop repeats of `key` within one batch, keeping the first document."""
+    seen = set()
+    unique = []
+    for doc in docs:
+        if doc[key] in seen:
+            continue
+        seen.add(doc[key])
+        unique.append(doc)
+    return unique
+
+
+class StoreError(RuntimeError):
+    """Writes other than duplicates failed. `stored` were written; `failed` maps key -> error."""
+
+    def __init__(self, collection_name: str, stored: List[Dict[str, Any]], failed: Dict[Any, str]):
+        super().__init__(f"{len(failed)} writes to {collection_name} failed: {next(iter(failed.values()))}")
+        self.stored = stored
+        self.failed = failed
+
+
+def _claim(key: Any) -> Dict[str, Any]:
+    return {"_id": key, "claimed_at": datetime.now(timezone.utc)}
+
+
+def _split_errors(docs: List[Dict[str, Any]], key: str, details: Dict[str, Any]):
+    """(keys already stored, {key: error} for every other failure) from a BulkWriteError's details."""
+    duplicates, failed = set(), {}
+    for err in details.get("writeErrors", []):
+        # A duplicate key means this message (or a concurrent writer's copy) is stored
+        if err.get("code") == DUPLICATE_KEY:
+            duplicates.add(docs[err["index"]][key])
+        else:
+            failed[docs[err["index"]][key]] = err.get("errmsg", "Write failed")
+    return duplicates, failed
+
+
+def _not_failed(docs: List[Dict[str, Any]], key: str, details: Dict[str, Any]):
+    duplicates, failed = _split_errors(docs, key, details)
+    return [doc for doc in docs if doc[key] not in duplicates and doc[key] not in failed], failed
+
+
+def _insert_new(collection, docs: List[Dict[str, Any]], key: str):
+    """insert_many(ordered=False): (documents written, {key: error}); duplicate keys are skipped."""
+    if not docs:
+        return [], {}
+    try:
+        collection.insert_many(docs, ordered=False)
+        return docs, {}
+    except BulkWriteError as e:
+        return _not_failed(docs, key, e.details)
+
+
+async def _insert_new_async(collection, docs: List[Dict[str, Any]], key: str):
+    if not docs:
+        return [], {}
+    try:
+        await collection.insert_many(docs, ordered=False)
+        return docs, {}
+    except BulkWriteError as e:
+        return _not_failed(docs, key, e.details)
+
+
+def store_new(collection, docs: List[Dict[str, Any]], key: str = MESSAGE_ID_FIELD, claims=None) -> List[Dict[str, Any]]:
+    """
+    Insert the `docs` whose `key` is not stored yet; return the ones written.
+
+    `collection` must have a unique index on `key`. Without one (a
+    time-series sensor_data), pass `claims` (sensor_data_claims): each key
+    is inserted there as an _id first and only the winners are written.
+    Raises StoreError for any failure other than a duplicate, after the
+    other documents have been written.
+    """
+    docs = first_by_key(docs, key)
+    failed = {}
+    if claims is not None and docs:
+        claimed, failed = _insert_new(claims, [_claim(doc[key]) for doc in docs], "_id")
+        won = {claim["_id"] for claim in claimed}
+        docs = [doc for doc in docs if doc[key] in won]
+
+    stored, write_failed = _insert_new(collection, docs, key)
+    if claims is not None and write_failed:
+        # Release the claims so a retry can store them
+        claims.delete_many({"_id": {"$in": list(write_failed)}})
+    failed.update(write_failed)
+    if failed:
+        raise StoreError(collection.name, stored, failed)
+    return stored
+
+
+async def store_new_async(collection, docs: List[Dict[str, Any]], key: str = MESSAGE_ID_FIELD,
+                          claims=None) -> List[Dict[str, Any]]:
+    docs = first_by_key(docs, key)
+    failed = {}
+    if claims is not None and docs:
+        claimed, failed = await _insert_new_async(claims, [_claim(doc[key]) for doc in docs], "_id")
+        won = {claim["_id"] for claim in claimed}
+        docs = [doc for doc in docs if doc[key] in won]
+
+    stored, write_failed = await _insert_new_async(collection, docs, key)
+    if claims is not None and write_failed:
+        await claims.delete_many({"_id": {"$in": list(write_failed)}})
+    failed.update(write_failed)
+    if failed:
+        raise StoreError(collection.name, stored, failed)
+    return stored
+
+
+def sensor_data_claims(db, timeseries: bool):
+    """The `claims` collection store_new needs for sensor_data (None when it has a unique index)."""
+    return db[MESSAGE_IDS] if timeseries else None
+
+
+def message_id_index(db, timeseries: bool):
+    """(collection, key, index options) that make sensor_data writes unique per message id."""
+    # Time-series collections can't have unique indexes, so the claims
+    # collection's _id stands in; old claims expire
+    if timeseries:
+        return db[MESSAGE_IDS], "claimed_at", {"name": "claimed_at_ttl", "expireAfterSeconds": MESSAGE_ID_TTL_DAYS * 86400}
+    return db.sensor_data, MESSAGE_ID_FIELD, {
+        "name": "message_id", "unique": True, "partialFilterExpression": {MESSAGE_ID_FIELD: {"$exists": True}}
+    }
+
+
+def ensure_message_id_index(db, timeseries: bool) -> str:
+    collection, key, options = message_id_index(db, timeseries)
+    return collection.create_index(key, **options)
+
+
+async def ensure_message_id_index_async(db, timeseries: bool) -> str:
+    collection, key, options = message_id_index(db, timeseries)
+    return await collection.create_index(key, **options)
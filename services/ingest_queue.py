@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from services.idempotency import StoreError, store_new
+
+# What to do when the queue is full
+OVERFLOW_BLOCK = "block"              # make the producer wait (backpressure)
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # evict the oldest buffered document
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        collection,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        max_age: float = 1.0,
+        overflow: str = OVERFLOW_BLOCK,
+        put_timeout: float = 5.0,
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        stats_interval: float = 0,
+        unique_key: Optional[str] = None,
+    ):
+        """
+        Bounded in-memory buffer drained by a background writer thread.
+
+        Documents are written with insert_many(ordered=False) as soon as
+        `batch_size` documents are buffered or the oldest buffered document
+        is `max_age` seconds old, whichever comes first. With `unique_key`
+        (a uniquely indexed field) documents already stored are skipped
+        rather than duplicated, and only the new ones reach on_flush.
+
+        Args:
+            collection: pymongo collection the batches are written to.
+            max_size (int): Maximum number of buffered documents.
+            batch_size (int): Flush as soon as this many documents are buffered.
+            max_age (float): Flush once the oldest document has waited this long (seconds).
+            overflow (str): "block" to apply backpressure, "drop_oldest" to evict.
+            put_timeout (float): How long put() may block before dropping the new document.
+            on_flush (callable, optional): Called with the newly written documents of each batch,
+                off the producer thread.
+            stats_interval (float): Print stats every N seconds (0 disables).
+            unique_key (str, optional): Uniquely indexed field identifying a document, e.g. "_id".
+        """
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.collection = collection
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.on_flush = on_flush
+        self.stats_interval = stats_interval
+        self.unique_key = unique_key
+
+        self._buffer = deque()
+        self._oldest_at = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self._counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "write_errors": 0,
+            "flushes": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_latency_ms": 0.0,
+            "max_flush_latency_ms": 0.0,
+            "total_flush_latency_ms": 0.0,
+        }
+
+    # -------------------------- Lifecycle --------------------------
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the writer thread after flushing whatever is still buffered."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # -------------------------- Producer side --------------------------
+
+    def put(self, doc: Dict[str, Any]) -> bool:
+        """Buffer a document. Returns False if it had to be dropped."""
+        with self._cond:
+            if len(self._buffer) >= self.max_size:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._buffer.popleft()
+                    self._counters["dropped"] += 1
+                else:
+                    deadline = time.monotonic() + self.put_timeout
+                    while len(self._buffer) >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._running:
+                            self._counters["dropped"] += 1
+                            return False
+                        self._cond.wait(remaining)
+
+            if not self._buffer:
+                self._oldest_at = time.monotonic()
+            self._buffer.append(doc)
+            self._counters["enqueued"] += 1
+
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._counters)
+            stats["queue_depth"] = len(self._buffer)
+        flushes = stats["flushes"]
+        stats["total_flush_latency_ms"] = round(stats["total_flush_latency_ms"], 2)
+        stats["avg_flush_size"] = round(stats["inserted"] / flushes, 1) if flushes else 0
+        stats["avg_flush_latency_ms"] = round(stats["total_flush_latency_ms"] / flushes, 2) if flushes else 0
+        return stats
+
+    # -------------------------- Writer side --------------------------
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        count = min(self.batch_size, len(self._buffer))
+        batch = [self._buffer.popleft() for _ in range(count)]
+        self._oldest_at = time.monotonic() if self._buffer else None
+        # Wake producers blocked on a full queue
+        self._cond.notify_all()
+        return batch
+
+    def _run(self):
+        last_stats = time.monotonic()
+        while True:
+            with self._cond:
+                while self._running:
+                    if len(self._buffer) >= self.batch_size:
+                        break
+                    if self._buffer and time.monotonic() - self._oldest_at >= self.max_age:
+                        break
+                    if self._buffer:
+                        wait_for = self.max_age - (time.monotonic() - self._oldest_at)
+                    else:
+                        wait_for = self.max_age
+                    self._cond.wait(max(wait_for, 0.01))
+
+                if not self._running and not self._buffer:
+                    return
+                batch = self._take_batch()
+
+            if batch:
+                self._flush(batch)
+
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                print("[Ingest Queue] Stats:", self.stats())
+                last_stats = time.monotonic()
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        written = []
+        duplicates = 0
+        errors = 0
+        try:
+            if self.unique_key:
+                written = store_new(self.collection, batch, self.unique_key)
+                duplicates = len(batch) - len(written)
+            else:
+                self.collection.insert_many(batch, ordered=False)
+                written = batch
+        except StoreError as e:
+            written = e.stored
+            errors = len(e.failed)
+            duplicates = len(batch) - len(written) - errors
+            print(f"[Ingest Queue] Partial flush: {len(written)} written, {errors} failed")
+        except BulkWriteError as e:
+            # Unordered: everything except the failed documents was written
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            written = [doc for i, doc in enumerate(batch) if i not in failed]
+            errors = len(failed)
+            if errors:
+                print(f"[Ingest Queue] Partial flush: {len(written)} written, {errors} failed")
+        except PyMongoError as e:
+            errors = len(batch)
+            print("[Ingest Queue] Flush failed:", e)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        with self._cond:
+            c = self._counters
+            c["flushes"] += 1
+            c["inserted"] += len(written)
+            c["duplicates"] += duplicates
+            c["write_errors"] += errors
+            c["last_flush_size"] = len(batch)
+            c["max_flush_size"] = max(c["max_flush_size"], len(batch))
+            c["last_flush_latency_ms"] = round(latency_ms, 2)
+            c["max_flush_latency_ms"] = max(c["max_flush_latency_ms"], round(latency_ms, 2))
+            c["total_flush_latency_ms"] += latency_ms
+
+        if self.on_flush and written:
+            try:
+                self.on_flush(written)
+            except Exception as e:
+                print("[Ingest Queue] on_flush callback failed:", e)
@@ -0,0 +1,193 @@
+# Ingestion core for curated sensor_data
+#
+# Validation, message id, idempotent write and rollups in one place, so the
+# API route and the MQTT receiver store readings the same way. The receiver
+# calls ingest_sensor_data_batch() in process for every flushed batch; the API
+# awaits ingest_sensor_data_async().
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import AliasChoices, BaseModel, Field, field_validator
+
+from database.timeseries import sensor_data_layout, sensor_data_layout_async
+from services.idempotency import (
+    DEVICE_TIME_FIELDS, StoreError, parse_time, payload_message_id, sensor_data_claims, store_new, store_new_async
+)
+from services.reading_cache import apply_last_readings, apply_last_readings_async
+from services.rollups import apply_rollups, apply_rollups_async
+
+
+class SensorReading(BaseModel):
+    sensor_name: str
+    status: str
+    reading: float
+    unit: str
+    note: Optional[str] = ""
+    sensor_health: Optional[str] = None
+    sensor_specification: Optional[str] = None
+
+class SensorDataIn(BaseModel):
+    device_id: str
+    sensor_id: str
+    readings: List[SensorReading]
+    # Retries carrying the same id are stored once
+    message_id: Optional[str] = Field(None, max_length=128)
+    # When the device took the reading (ts / timestamp / created_at); the
+    # server time stands in when it is missing
+    created_at: Optional[datetime] = Field(None, validation_alias=AliasChoices(*DEVICE_TIME_FIELDS))
+    # Device sequence number; with the device time it identifies the reading
+    seq: Optional[int] = None
+
+    @field_validator("created_at")
+    @classmethod
+    def _utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Naive device times are UTC
+        return parse_time(value)
+
+
+class SensorNotFound(LookupError):
+    pass
+
+
+def update_summaries(db, docs: List[Dict[str, Any]]):
+    """Rollups and shared last readings for newly stored (flat) sensor_data documents."""
+    apply_rollups(db, docs)
+    apply_last_readings(db, docs)
+
+
+async def update_summaries_async(db, docs: List[Dict[str, Any]]):
+    await apply_rollups_async(db, docs)
+    await apply_last_readings_async(db, docs)
+
+
+def reading_message_id(data: SensorDataIn) -> str:
+    """The message id for validated input, derived as the MQTT receiver does (see payload_message_id)."""
+    return payload_message_id(data.model_dump(mode="json", exclude_none=True))
+
+
+def sensor_data_document(data: SensorDataIn, created_at: datetime, mid: Optional[str] = None) -> Dict[str, Any]:
+    """The curated sensor_data document for validated input (flat: see SensorDataLayout)."""
+    return {
+        "sensor_id": data.sensor_id,
+        "device_id": data.device_id,
+        "created_at": created_at,
+        "message_id": mid or reading_message_id(data),
+        "readings": [reading.model_dump() for reading in data.readings]
+    }
+
+
+def _result(document: Dict[str, Any], stored: bool) -> Dict[str, Any]:
+    return {"stored": stored, "message_id": document["message_id"], "document": document}
+
+
+def ingest_sensor_data(db, data: SensorDataIn) -> Dict[str, Any]:
+    """
+    Store one validated reading set in sensor_data and update the rollups.
+
+    Raises SensorNotFound for an unknown sensor_id, StoreError if the write
+    fails. A message_id that is already stored is not written again and
+    returns stored=False.
+    """
+    if not db.sensors.find_one({"_id": data.sensor_id}, {"_id": 1}):
+        raise SensorNotFound(data.sensor_id)
+
+    document = sensor_data_document(data, data.created_at or datetime.now(timezone.utc))
+    layout = sensor_data_layout(db)
+    stored = store_new(db.sensor_data, [layout.document(document)], claims=sensor_data_claims(db, layout.timeseries))
+    if stored:
+        update_summaries(db, [document])
+    return _result(document, bool(stored))
+
+
+async def ingest_sensor_data_async(db, data: SensorDataIn) -> Dict[str, Any]:
+    if not await db.sensors.find_one({"_id": data.sensor_id}, {"_id": 1}):
+        raise SensorNotFound(data.sensor_id)
+
+    document = sensor_data_document(data, data.created_at or datetime.now(timezone.utc))
+    layout = await sensor_data_layout_async(db)
+    stored = await store_new_async(db.sensor_data, [layout.document(document)],
+                                   claims=sensor_data_claims(db, layout.timeseries))
+    if stored:
+        await update_summaries_async(db, [document])
+    return _result(document, bool(stored))
+
+
+# One entry per item of a batch: its _result, or the error that item hit
+BatchOutcome = Union[Dict[str, Any], SensorNotFound, StoreError]
+
+
+def _batch_documents(items: List[SensorDataIn], known) -> Dict[int, Dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    return {
+        i: sensor_data_document(data, data.created_at or now)
+        for i, data in enumerate(items) if data.sensor_id in known
+    }
+
+
+def _batch_outcomes(items: List[SensorDataIn], documents: Dict[int, Dict[str, Any]],
+                    stored: List[Dict[str, Any]], error: Optional[StoreError]):
+    """(outcome per item, the documents to roll up)."""
+    new = {doc["message_id"] for doc in stored}
+    outcomes: List[BatchOutcome] = []
+    fresh = []
+    for i, data in enumerate(items):
+        document = documents.get(i)
+        if document is None:
+            outcomes.append(SensorNotFound(data.sensor_id))
+        elif error and document["message_id"] in error.failed:
+            outcomes.append(error)
+        else:
+            # A repeat within the batch is a duplicate of the first copy
+            is_new = document["message_id"] in new
+            new.discard(document["message_id"])
+            outcomes.append(_result(document, is_new))
+            if is_new:
+                fresh.append(document)
+    return outcomes, fresh
+
+
+def ingest_sensor_data_batch(db, items: List[SensorDataIn]) -> List[BatchOutcome]:
+    """
+    ingest_sensor_data for many reading sets: one sensor lookup, one
+    insert_many, one rollup write per resolution and one last-readings
+    write for the whole batch.
+
+    Returns one outcome per item, in order: its result dict, or the
+    SensorNotFound / StoreError it hit (the other items are still stored).
+    """
+    sensor_ids = list({data.sensor_id for data in items})
+    known = {s["_id"] for s in db.sensors.find({"_id": {"$in": sensor_ids}}, {"_id": 1})} if sensor_ids else set()
+    documents = _batch_documents(items, known)
+
+    layout = sensor_data_layout(db)
+    stored, error = [], None
+    try:
+        stored = store_new(db.sensor_data, [layout.document(doc) for doc in documents.values()],
+                           claims=sensor_data_claims(db, layout.timeseries))
+    except StoreError as e:
+        stored, error = e.stored, e
+
+    outcomes, fresh = _batch_outcomes(items, documents, stored, error)
+    if fresh:
+        update_summaries(db, fresh)
+    return outcomes
+
+
+async def ingest_sensor_data_batch_async(db, items: List[SensorDataIn]) -> List[BatchOutcome]:
+    sensor_ids = list({data.sensor_id for data in items})
+    known = {s["_id"] async for s in db.sensors.find({"_id": {"$in": sensor_ids}}, {"_id": 1})} if sensor_ids else set()
+    documents = _batch_documents(items, known)
+
+    layout = await sensor_data_layout_async(db)
+    stored, error = [], None
+    try:
+        stored = await store_new_async(db.sensor_data, [layout.document(doc) for doc in documents.values()],
+                                       claims=sensor_data_claims(db, layout.timeseries))
+    except StoreError as e:
+        stored, error = e.stored, e
+
+    outcomes, fresh = _batch_outcomes(items, documents, stored, error)
+    if fresh:
+        await update_summaries_async(db, fresh)
+    return outcomes
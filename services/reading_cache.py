@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+from database.timeseries import sensor_data_layout
+
+CacheKey = Tuple[str, str]  # (sensor_id, sensor_name)
+
+# Last stored reading per (sensor_id, sensor_name), shared by every receiver
+# process. Workers of a $share group see different readings of one sensor,
+# so each refreshes its cache from here before judging a batch
+LAST_READINGS = "sensor_last_readings"
+
+
+def _utc(value: datetime) -> datetime:
+    # pymongo returns naive UTC datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def last_reading_operations(docs: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """Upserts that keep the newest reading of every key in `docs`, whatever order writers run in."""
+    ops = []
+    for doc in docs:
+        created_at = doc["created_at"]
+        newer = {"$lt": [{"$ifNull": ["$created_at", None]}, {"$literal": created_at}]}
+        for reading in doc.get("readings", []):
+            ops.append(UpdateOne(
+                {"_id": {"sensor_id": doc["sensor_id"], "sensor_name": reading["sensor_name"]}},
+                [{"$set": {
+                    "sensor_id": doc["sensor_id"],
+                    "reading": {"$cond": [newer, {"$literal": reading["reading"]}, "$reading"]},
+                    "created_at": {"$cond": [newer, {"$literal": created_at}, "$created_at"]},
+                }}],
+                upsert=True,
+            ))
+    return ops
+
+
+def apply_last_readings(db, docs: Iterable[Dict[str, Any]]):
+    ops = last_reading_operations(docs)
+    if ops:
+        db[LAST_READINGS].bulk_write(ops, ordered=False)
+
+
+async def apply_last_readings_async(db, docs: Iterable[Dict[str, Any]]):
+    ops = last_reading_operations(docs)
+    if ops:
+        await db[LAST_READINGS].bulk_write(ops, ordered=False)
+
+
+def ensure_last_readings_index(db):
+    db[LAST_READINGS].create_index([("sensor_id", ASCENDING)])
+
+
+async def ensure_last_readings_index_async(db):
+    await db[LAST_READINGS].create_index([("sensor_id", ASCENDING)])
+
+
+class LastReadingCache:
+    def __init__(self, max_size: int = 50000):
+        """
+        LRU cache of the last stored reading per (sensor_id, sensor_name).
+
+        Sensors that go quiet fall off the end once `max_size` keys are held,
+        and a later reading for them simply counts as a miss.
+
+        Args:
+            max_size (int): Maximum number of (sensor_id, sensor_name) keys kept.
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sensor_id: str, sensor_name: str) -> Optional[Dict[str, Any]]:
+        """Return {"reading", "created_at"} for the key, or None on a miss."""
+        key = (sensor_id, sensor_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, sensor_id: str, sensor_name: str, reading: Any, created_at: Optional[datetime] = None):
+        key = (sensor_id, sensor_name)
+        entry = {"reading": reading, "created_at": created_at or datetime.now(timezone.utc)}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _merge(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Cache shared LAST_READINGS rows, unless the cached reading is newer."""
+        merged = 0
+        for row in rows:
+            key = row["_id"]
+            with self._lock:
+                cached = self._entries.get((key["sensor_id"], key["sensor_name"]))
+            if cached and _utc(cached["created_at"]) >= _utc(row["created_at"]):
+                continue
+            self.set(key["sensor_id"], key["sensor_name"], row["reading"], row["created_at"])
+            merged += 1
+        return merged
+
+    def refresh(self, collection, sensor_ids: Iterable[str]) -> int:
+        """
+        Bring the readings of `sensor_ids` up to date from the shared
+        LAST_READINGS `collection`, in one query. Returns how many changed.
+        """
+        ids = list(set(sensor_ids))
+        if not ids:
+            return 0
+        try:
+            rows = list(collection.find({"sensor_id": {"$in": ids}}))
+        except Exception as e:
+            # Judge against the cached readings rather than drop the batch
+            print("[Reading Cache] Failed to refresh last readings:", e)
+            return 0
+        return self._merge(rows)
+
+    async def refresh_async(self, collection, sensor_ids: Iterable[str]) -> int:
+        ids = list(set(sensor_ids))
+        if not ids:
+            return 0
+        try:
+            rows = [row async for row in collection.find({"sensor_id": {"$in": ids}})]
+        except Exception as e:
+            print("[Reading Cache] Failed to refresh last readings:", e)
+            return 0
+        return self._merge(rows)
+
+    def update_from_document(self, doc: Dict[str, Any]):
+        """Record every reading of a stored sensor_data document."""
+        sensor_id = doc.get("sensor_id")
+        if not sensor_id:
+            return
+        created_at = doc.get("created_at")
+        for reading in doc.get("readings", []):
+            self.set(sensor_id, reading["sensor_name"], reading["reading"], created_at)
+
+    def warm(self, collection, lookback_days: int = 7) -> int:
+        """
+        Load the latest reading of every (sensor_id, sensor_name) seen in
+        the last `lookback_days` days from the sensor_data collection.
+        """
+        since = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+        sensor_id = "$" + sensor_data_layout(collection.database).field("sensor_id")
+        pipeline = [
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$sort": {"created_at": -1}},
+            {"$unwind": "$readings"},
+            {"$group": {
+                "_id": {"sensor_id": sensor_id, "sensor_name": "$readings.sensor_name"},
+                "reading": {"$first": "$readings.reading"},
+                "created_at": {"$first": "$created_at"},
+            }},
+            {"$sort": {"created_at": -1}},
+            {"$limit": self.max_size},
+        ]
+        rows = list(collection.aggregate(pipeline, allowDiskUse=True))
+        # Oldest first so the most recently active sensors end up hottest in the LRU
+        for row in reversed(rows):
+            key = row["_id"]
+            if key.get("sensor_id") and key.get("sensor_name"):
+                self.set(key["sensor_id"], key["sensor_name"], row["reading"], row["created_at"])
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
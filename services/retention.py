@@ -0,0 +1,166 @@
+# Retention and tiered downsampling for sensor_data
+#
+# Default policy (override in .env):
+#   raw sensor_data      30 days   (RAW_RETENTION_DAYS)
+#   sensor_rollup_1m    365 days   (ROLLUP_1M_RETENTION_DAYS)
+#   sensor_rollup_1h    730 days   (ROLLUP_1H_RETENTION_DAYS)
+#   sensor_rollup_1d    forever    (ROLLUP_1D_RETENTION_DAYS, empty = forever)
+#   sensor_data_raw      30 days   (RAW_ARCHIVE_RETENTION_DAYS)
+#
+# Raw data is never dropped by a TTL index: the job first recomputes the
+# rollups of each expired day from raw data, then deletes that day. Rollup
+# collections expire through TTL indexes on bucket_start, the MQTT raw
+# archive through one on received_at.
+#
+#   python services/retention.py --dry-run          # report what would be reclaimed
+#   python services/retention.py                    # compact once
+#   python services/retention.py --every 3600       # compact every hour
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import OperationFailure
+
+from services.idempotency import RAW_ARCHIVE
+from services.rollups import ROLLUPS, rebuild_rollups
+
+# collection -> date field its TTL index expires documents on
+TTL_FIELDS = {
+    **{collection: "bucket_start" for collection, _, _ in ROLLUPS.values()},
+    RAW_ARCHIVE: "received_at",
+}
+
+
+def _days(name: str, default: str) -> Optional[int]:
+    value = os.getenv(name, default)
+    return int(value) if value else None
+
+
+def retention_policy() -> Dict[str, Optional[int]]:
+    """Collection -> days to keep (None keeps forever)."""
+    return {
+        "sensor_data": _days("RAW_RETENTION_DAYS", "30"),
+        ROLLUPS["1m"][0]: _days("ROLLUP_1M_RETENTION_DAYS", "365"),
+        ROLLUPS["1h"][0]: _days("ROLLUP_1H_RETENTION_DAYS", "730"),
+        ROLLUPS["1d"][0]: _days("ROLLUP_1D_RETENTION_DAYS", ""),
+        RAW_ARCHIVE: _days("RAW_ARCHIVE_RETENTION_DAYS", "30"),
+    }
+
+
+def _cutoff(days: int) -> datetime:
+    # Whole UTC days, so every compacted window covers complete 1d buckets
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def avg_document_size(db, name: str) -> float:
+    try:
+        stats = db.command("collStats", name)
+        if stats.get("avgObjSize"):
+            return float(stats["avgObjSize"])
+        if stats.get("count"):
+            return stats.get("size", 0) / stats["count"]
+    except OperationFailure:
+        pass
+    # Time-series collections don't report avgObjSize; sample instead
+    sample = list(db[name].aggregate([
+        {"$sample": {"size": 1000}},
+        {"$group": {"_id": None, "avg": {"$avg": {"$bsonSize": "$$ROOT"}}}},
+    ]))
+    return float(sample[0]["avg"]) if sample else 0.0
+
+
+def ensure_ttl_indexes(db, policy: Optional[Dict[str, Optional[int]]] = None):
+    """TTL indexes for the collections in TTL_FIELDS that have a retention period."""
+    policy = policy or retention_policy()
+    for collection, field in TTL_FIELDS.items():
+        days = policy.get(collection)
+        if not days:
+            continue
+        seconds = days * 86400
+        name = f"{field}_ttl"
+        try:
+            db[collection].create_index(field, expireAfterSeconds=seconds, name=name)
+        except OperationFailure:
+            # Index exists with another expiry: update it in place
+            db.command("collMod", collection, index={"name": name, "expireAfterSeconds": seconds})
+
+
+def compact(db, dry_run: bool = False, batch_days: int = 1,
+            policy: Optional[Dict[str, Optional[int]]] = None) -> Dict[str, Any]:
+    """
+    Downsample and delete raw sensor_data older than the raw retention period.
+
+    Works through the expired range `batch_days` at a time, oldest first:
+    rebuild the rollups of the window from raw data, then delete it.
+    """
+    policy = policy or retention_policy()
+    report: Dict[str, Any] = {"dry_run": dry_run, "collections": {}}
+
+    raw_days = policy.get("sensor_data")
+    if raw_days:
+        cutoff = _cutoff(raw_days)
+        expired = {"created_at": {"$lt": cutoff}}
+        count = db.sensor_data.count_documents(expired)
+        entry = {
+            "cutoff": cutoff.isoformat(),
+            "documents": count,
+            "estimated_bytes": int(count * avg_document_size(db, "sensor_data")) if count else 0,
+        }
+        report["collections"]["sensor_data"] = entry
+
+        if count and not dry_run:
+            oldest = db.sensor_data.find_one(expired, {"created_at": 1}, sort=[("created_at", 1)])
+            window_start = oldest["created_at"].replace(hour=0, minute=0, second=0, microsecond=0)
+            deleted = 0
+            while window_start < cutoff:
+                window_end = min(window_start + timedelta(days=batch_days), cutoff)
+                rebuild_rollups(db, window_start, window_end)
+                result = db.sensor_data.delete_many({"created_at": {"$gte": window_start, "$lt": window_end}})
+                deleted += result.deleted_count
+                print(f"[Retention] {window_start.date()} .. {window_end.date()}: "
+                      f"downsampled and deleted {result.deleted_count} raw documents")
+                window_start = window_end
+            entry["deleted"] = deleted
+
+    # Rollups and the raw archive expire through TTL indexes; report what is due
+    for collection, field in TTL_FIELDS.items():
+        days = policy.get(collection)
+        if not days:
+            continue
+        count = db[collection].count_documents({field: {"$lt": _cutoff(days)}})
+        report["collections"][collection] = {
+            "cutoff": _cutoff(days).isoformat(),
+            "documents": count,
+            "estimated_bytes": int(count * avg_document_size(db, collection)) if count else 0,
+            "expired_by": "ttl",
+        }
+
+    if not dry_run:
+        ensure_ttl_indexes(db, policy)
+
+    report["estimated_bytes"] = sum(c["estimated_bytes"] for c in report["collections"].values())
+    return report
+
+
+if __name__ == "__main__":
+    from database.connection import get_database
+
+    parser = argparse.ArgumentParser(description="Apply the sensor_data retention policy")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be reclaimed")
+    parser.add_argument("--batch-days", type=int, default=1, help="Days of raw data compacted per batch")
+    parser.add_argument("--every", type=int, default=0, help="Repeat every N seconds (0 = run once)")
+    args = parser.parse_args()
+
+    db = get_database()
+    while True:
+        summary = compact(db, dry_run=args.dry_run, batch_days=args.batch_days)
+        print("[Retention] Report:", summary)
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,221 @@
+# Pre-aggregated rollups of sensor_data
+#
+# Every write to sensor_data also upserts one document per
+# (sensor_id, sensor_name, bucket_start) into sensor_rollup_1m / _1h / _1d
+# using $inc / $min / $max, so long-range charts read O(buckets) documents.
+#
+#   python services/rollups.py --rebuild --start 2025-01-01T00:00:00 --end 2025-02-01T00:00:00 [--sensor-id SENS001]
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ASCENDING, UpdateOne
+
+from database.timeseries import sensor_data_layout
+
+# resolution -> (collection, bucket size in seconds, $dateTrunc unit)
+ROLLUPS = {
+    "1m": ("sensor_rollup_1m", 60, "minute"),
+    "1h": ("sensor_rollup_1h", 3600, "hour"),
+    "1d": ("sensor_rollup_1d", 86400, "day"),
+}
+ROLLUP_KEY = ["sensor_id", "sensor_name", "bucket_start"]
+# Rebuilds leave buckets newer than this many seconds to the live $inc writes
+ROLLUP_REBUILD_LAG = int(os.getenv("ROLLUP_REBUILD_LAG", "3600"))
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # pymongo stores and returns naive UTC datetimes
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def bucket_start(value: datetime, seconds: int) -> datetime:
+    value = _naive_utc(value)
+    epoch = int(value.replace(tzinfo=timezone.utc).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def rollup_operations(docs: Iterable[Dict[str, Any]]) -> Dict[str, List[UpdateOne]]:
+    """
+    Build the upserts for a batch of sensor_data documents, one per
+    rollup collection and key. Readings for the same key are combined
+    in memory first, so a batch costs one write per touched bucket.
+    """
+    accumulators = {resolution: {} for resolution in ROLLUPS}
+    for doc in docs:
+        sensor_id = doc.get("sensor_id")
+        created_at = doc.get("created_at")
+        if not sensor_id or not isinstance(created_at, datetime):
+            continue
+        created_at = _naive_utc(created_at)
+        for reading in doc.get("readings", []):
+            value = reading.get("reading")
+            if not _is_number(value) or not reading.get("sensor_name"):
+                continue
+            sensor_name = str(reading["sensor_name"]).lower()
+            sample = {"at": created_at, "value": value}
+            for resolution, (_, seconds, _) in ROLLUPS.items():
+                key = (sensor_id, sensor_name, bucket_start(created_at, seconds))
+                acc = accumulators[resolution].get(key)
+                if acc is None:
+                    accumulators[resolution][key] = {
+                        "count": 1, "sum": value, "min": value, "max": value,
+                        "first": sample, "last": sample,
+                    }
+                    continue
+                acc["count"] += 1
+                acc["sum"] += value
+                acc["min"] = min(acc["min"], value)
+                acc["max"] = max(acc["max"], value)
+                if sample["at"] < acc["first"]["at"]:
+                    acc["first"] = sample
+                if sample["at"] >= acc["last"]["at"]:
+                    acc["last"] = sample
+
+    operations = {}
+    for resolution, keyed in accumulators.items():
+        if not keyed:
+            continue
+        operations[resolution] = [
+            UpdateOne(
+                {"sensor_id": sensor_id, "sensor_name": sensor_name, "bucket_start": start},
+                {
+                    "$inc": {"count": acc["count"], "sum": acc["sum"]},
+                    # {at, value} documents compare on `at` first, so $min / $max
+                    # keep the earliest / latest sample of the bucket
+                    "$min": {"min": acc["min"], "first": acc["first"]},
+                    "$max": {"max": acc["max"], "last": acc["last"]},
+                },
+                upsert=True,
+            )
+            for (sensor_id, sensor_name, start), acc in keyed.items()
+        ]
+    return operations
+
+
+def apply_rollups(db, docs: Iterable[Dict[str, Any]]):
+    for resolution, ops in rollup_operations(docs).items():
+        db[ROLLUPS[resolution][0]].bulk_write(ops, ordered=False)
+
+
+async def apply_rollups_async(db, docs: Iterable[Dict[str, Any]]):
+    for resolution, ops in rollup_operations(docs).items():
+        await db[ROLLUPS[resolution][0]].bulk_write(ops, ordered=False)
+
+
+def ensure_rollup_indexes(db):
+    for collection, _, _ in ROLLUPS.values():
+        db[collection].create_index([(field, ASCENDING) for field in ROLLUP_KEY], unique=True)
+
+
+async def ensure_rollup_indexes_async(db):
+    for collection, _, _ in ROLLUPS.values():
+        await db[collection].create_index([(field, ASCENDING) for field in ROLLUP_KEY], unique=True)
+
+
+def rebuild_rollups(db, start: datetime, end: datetime, sensor_id: Optional[str] = None,
+                    resolutions: Iterable[str] = tuple(ROLLUPS), lag: int = ROLLUP_REBUILD_LAG) -> Dict[str, int]:
+    """
+    Recompute rollups from raw sensor_data for [start, end).
+
+    The range is widened to whole buckets of each resolution, existing
+    rollup documents in it are removed, and the aggregation result is
+    $merge-d back into the rollup collection.
+
+    Ingestion keeps updating rollups with $inc / $min / $max while this
+    runs, and a reading stored between the delete and the $merge would be
+    overwritten. So only buckets that ended at least `lag` seconds ago are
+    rebuilt; newer ones are left to the live writes. Devices replaying
+    readings older than `lag` during a rebuild can still be undercounted,
+    so pick a lag longer than they buffer.
+    """
+    ensure_rollup_indexes(db)
+    layout = sensor_data_layout(db)
+    safe_end = datetime.now(timezone.utc) - timedelta(seconds=lag)
+    rebuilt = {}
+    for resolution in resolutions:
+        collection, seconds, unit = ROLLUPS[resolution]
+        lo = bucket_start(start, seconds)
+        hi = bucket_start(end, seconds)
+        if hi < _naive_utc(end):
+            hi += timedelta(seconds=seconds)
+        # Never into a bucket that is still within the lag
+        hi = min(hi, bucket_start(safe_end, seconds))
+        if hi <= lo:
+            print(f"[Rollups] Skipped {resolution}: no bucket in range ended more than {lag}s ago")
+            rebuilt[resolution] = 0
+            continue
+
+        scope = {"bucket_start": {"$gte": lo, "$lt": hi}}
+        match = {"created_at": {"$gte": lo, "$lt": hi}}
+        if sensor_id:
+            scope["sensor_id"] = sensor_id
+            match[layout.field("sensor_id")] = sensor_id
+
+        db[collection].delete_many(scope)
+        db.sensor_data.aggregate([
+            {"$match": match},
+            {"$sort": {"created_at": 1}},
+            {"$unwind": "$readings"},
+            {"$match": {"readings.reading": {"$type": "number"}}},
+            {"$group": {
+                "_id": {
+                    "sensor_id": "$" + layout.field("sensor_id"),
+                    "sensor_name": {"$toLower": "$readings.sensor_name"},
+                    "bucket_start": {"$dateTrunc": {"date": "$created_at", "unit": unit}},
+                },
+                "count": {"$sum": 1},
+                "sum": {"$sum": "$readings.reading"},
+                "min": {"$min": "$readings.reading"},
+                "max": {"$max": "$readings.reading"},
+                "first": {"$first": {"at": "$created_at", "value": "$readings.reading"}},
+                "last": {"$last": {"at": "$created_at", "value": "$readings.reading"}},
+            }},
+            {"$project": {
+                "_id": 0,
+                "sensor_id": "$_id.sensor_id",
+                "sensor_name": "$_id.sensor_name",
+                "bucket_start": "$_id.bucket_start",
+                "count": 1, "sum": 1, "min": 1, "max": 1, "first": 1, "last": 1,
+            }},
+            {"$merge": {"into": collection, "on": ROLLUP_KEY, "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+        rebuilt[resolution] = db[collection].count_documents(scope)
+        print(f"[Rollups] Rebuilt {rebuilt[resolution]} {resolution} buckets")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    from database.connection import get_database
+
+    parser = argparse.ArgumentParser(description="Maintain sensor_data rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute rollups from raw data")
+    parser.add_argument("--start", required=True, help="Format: YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument("--end", help="Format: YYYY-MM-DDTHH:MM:SS (default: now)")
+    parser.add_argument("--sensor-id")
+    parser.add_argument("--resolution", choices=list(ROLLUPS), action="append")
+    parser.add_argument("--lag", type=int, default=ROLLUP_REBUILD_LAG,
+                        help="Leave buckets that ended less than this many seconds ago to live writes")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        sys.exit(1)
+
+    rebuild_rollups(
+        get_database(),
+        datetime.fromisoformat(args.start),
+        datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc),
+        sensor_id=args.sensor_id,
+        resolutions=args.resolution or list(ROLLUPS),
+        lag=args.lag,
+    )
+    print("✅ Rollup rebuild completed.")
@@ -0,0 +1,144 @@
+# Indexed, case-insensitive search for device and location filters
+#
+# Each searchable field is stored twice more on write:
+#   search.<key>   the casefolded, whitespace-collapsed value (prefix search
+#                  is an anchored regex on it, which is an index range scan)
+#   search_grams   "<key>:<gram>" for the 3-character window at every position
+#                  (shorter at the end), so a contains-search for q is
+#                  - len(q) <= 3: an anchored regex on search_grams
+#                  - len(q) > 3:  $all of q's trigrams, then a check of search.<key>
+# Both are multikey / plain indexes (database/indexes.py). Documents written
+# before this existed are filled in by backfill_search_fields, a full scan run
+# once offline; the run is recorded in the `migrations` collection.
+#
+#   python services/search.py          # backfill search fields
+
+import os
+import re
+import sys
+import unicodedata
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import UpdateOne
+
+GRAM = 3
+SEARCH_FIELD = "search"
+GRAMS_FIELD = "search_grams"
+# Stored on every search-enabled document but never returned by the API
+SEARCH_PROJECTION = {SEARCH_FIELD: 0, GRAMS_FIELD: 0}
+MIGRATION_ID = "search_fields_backfill"
+
+# collection -> searchable document fields
+SEARCHABLE = {
+    "devices": ("device_name", "location_mark"),
+    "locations": ("name", "address.city", "address.state", "address.country"),
+}
+
+def normalize(value: Any) -> str:
+    """Casefolded, NFKC-normalized, whitespace-collapsed text."""
+    return " ".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+
+def field_key(field: str) -> str:
+    return field.replace(".", "_")
+
+
+def grams(text: str) -> List[str]:
+    """Every GRAM-long window of text, plus the shorter tails at the end."""
+    return [text[i:i + GRAM] for i in range(len(text))]
+
+
+def _get(doc: Dict[str, Any], field: str) -> Optional[Any]:
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def search_fields(collection: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """search / search_grams for a full document of `collection`."""
+    normalized, tokens = {}, set()
+    for field in SEARCHABLE[collection]:
+        value = _get(doc, field)
+        if value is None:
+            continue
+        key = field_key(field)
+        normalized[key] = normalize(value)
+        tokens.update(f"{key}:{g}" for g in grams(normalized[key]))
+    return {SEARCH_FIELD: normalized, GRAMS_FIELD: sorted(tokens)}
+
+
+def with_search(collection: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of doc with its search fields, ready to insert."""
+    return {**doc, **search_fields(collection, doc)}
+
+
+def search_filter(field: str, value: str, mode: str = "contains") -> Dict[str, Any]:
+    """Indexed, case-insensitive filter for `value` in a searchable field."""
+    key, text = field_key(field), normalize(value)
+    if not text:
+        return {}
+    if mode == "prefix":
+        return {f"{SEARCH_FIELD}.{key}": {"$regex": "^" + re.escape(text)}}
+    if len(text) <= GRAM:
+        return {GRAMS_FIELD: {"$regex": "^" + re.escape(f"{key}:{text}")}}
+    return {
+        GRAMS_FIELD: {"$all": [f"{key}:{g}" for g in grams(text) if len(g) == GRAM]},
+        f"{SEARCH_FIELD}.{key}": {"$regex": re.escape(text)},
+    }
+
+
+def combine(query: Dict[str, Any], filters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """AND search filters into query (several may constrain search_grams)."""
+    filters = [f for f in filters if f]
+    if not filters:
+        return query
+    return {"$and": [query, *filters]}
+
+
+def rank_stage(terms: Dict[str, str]) -> Dict[str, Any]:
+    """$set a _score: per searched field, 3 for an exact match, 2 for a prefix, 1 otherwise."""
+    scores = []
+    for field, value in terms.items():
+        stored, text = f"${SEARCH_FIELD}.{field_key(field)}", normalize(value)
+        scores.append({"$switch": {"branches": [
+            {"case": {"$eq": [stored, text]}, "then": 3},
+            {"case": {"$eq": [{"$substrCP": [{"$ifNull": [stored, ""]}, 0, len(text)]}, text]}, "then": 2},
+        ], "default": 1}})
+    return {"$set": {"_score": {"$add": scores} if scores else 0}}
+
+
+def backfill_search_fields(db, collection: str, batch_size: int = 1000) -> int:
+    """Add search fields to documents written before they existed."""
+    updated, ops = 0, []
+    for doc in db[collection].find({SEARCH_FIELD: {"$exists": False}}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(collection, doc)}))
+        if len(ops) >= batch_size:
+            updated += db[collection].bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db[collection].bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+async def search_backfill_done_async(db) -> bool:
+    """Whether `python services/search.py` has run against this database."""
+    return await db.migrations.find_one({"_id": MIGRATION_ID}, {"_id": 1}) is not None
+
+
+if __name__ == "__main__":
+    from database.connection import get_database
+
+    db = get_database()
+    updated = {}
+    for name in SEARCHABLE:
+        updated[name] = backfill_search_fields(db, name)
+        print(f"✅ {name}: {updated[name]} documents updated")
+    db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"updated": updated, "completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
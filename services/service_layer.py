@@ -1,63 +1,259 @@
+import os
+import threading
 import requests
-from typing import Dict, Any
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
 
+from pydantic import ValidationError
+from requests.adapters import HTTPAdapter
+
+from services.deadband import DeadbandEngine, REASON_FIRST, REASON_SUPPRESSED
+from services.ingestion import (
+    SensorDataIn,
+    SensorNotFound,
+    ingest_sensor_data,
+    ingest_sensor_data_async,
+    ingest_sensor_data_batch,
+    ingest_sensor_data_batch_async,
+)
+from services.reading_cache import LAST_READINGS, LastReadingCache
+
+# "direct": store through services.ingestion in this process (needs configure_ingestion(db))
+# "http":   POST to the FastAPI endpoint below over a pooled keep-alive session
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
 # ✅ Use your actual FastAPI endpoint, not Mongo URI
-API_URL = "http://localhost:5000/sensors/sensor-data"
-GET_LATEST_URL_TEMPLATE = "http://localhost:5000/sensors/{sensor_id}/last-data"
+API_URL = os.getenv("SENSOR_DATA_API_URL", "http://localhost:5000/sensors/sensor-data")
+HTTP_POOL_SIZE = int(os.getenv("SENSOR_DATA_API_POOL_SIZE", "10"))
+HTTP_TIMEOUT = float(os.getenv("SENSOR_DATA_API_TIMEOUT", "10"))
 
-# Check if difference is significant
-def is_significant_change(a: float, b: float, threshold: float = -2) -> bool:
-    # return abs(a - b) >= threshold
-    return True
+_ingest_db = None
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Last stored reading per (sensor_id, sensor_name), so change detection
+# does not need a round trip to /sensors/{sensor_id}/last-data
+LAST_READINGS_CACHE_SIZE = int(os.getenv("LAST_READINGS_CACHE_SIZE", "50000"))
+last_readings = LastReadingCache(max_size=LAST_READINGS_CACHE_SIZE)
+
+# Per-sensor deadband / heartbeat thresholds, read from the sensors collection
+deadband = DeadbandEngine()
+
+
+def warm_last_readings(sensor_data_collection, lookback_days: int = 7) -> int:
+    """Prime the last-readings cache from MongoDB. Call once at startup."""
+    loaded = last_readings.warm(sensor_data_collection, lookback_days=lookback_days)
+    print(f"[Service Layer] Warmed last-readings cache with {loaded} entries")
+    return loaded
+
+
+def configure_change_detection(sensors_collection, refresh_interval: float = 60):
+    """Read deadband thresholds from sensor metadata instead of the defaults."""
+    deadband.sensors_collection = sensors_collection
+    deadband.refresh_interval = refresh_interval
+    deadband.invalidate()
+
+
+def configure_ingestion(db=None, mode: Optional[str] = None):
+    """Store in process through `db` (sync pymongo database), or over HTTP if mode="http"."""
+    global _ingest_db, INGEST_MODE
+    _ingest_db = db
+    if mode:
+        INGEST_MODE = mode
+
+
+def http_session() -> requests.Session:
+    # One session per process: connections to the API are kept alive and reused
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _stored_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {"status": 200, "response": {"message_id": result["message_id"], "stored": result["stored"]}}
 
-# Main function to call from MQTT receiver
-def add_sensor_data_if_changed_via_api(data: Dict[str, Any]) -> Dict[str, Any]:
-    sensor_id = data.get("sensor_id")
-    if not sensor_id:
-        return {"error": "sensor_id missing in payload"}
 
-    # Correctly build GET URL
-    latest_url = GET_LATEST_URL_TEMPLATE.format(sensor_id=sensor_id)
+def _failed_response(error: Exception) -> Dict[str, Any]:
+    if isinstance(error, SensorNotFound):
+        return {"error": "Sensor not found", "status": 404}
+    return {"error": "Failed to store sensor data", "exception": str(error)}
+
+
+def _batch_responses(outcomes) -> List[Dict[str, Any]]:
+    return [_failed_response(o) if isinstance(o, Exception) else _stored_response(o) for o in outcomes]
+
+
+def store_direct(data: SensorDataIn) -> Dict[str, Any]:
+    if _ingest_db is None:
+        return {"error": "Direct ingestion not configured; call configure_ingestion(db)"}
+    try:
+        return _stored_response(ingest_sensor_data(_ingest_db, data))
+    except SensorNotFound:
+        return {"error": "Sensor not found", "status": 404}
+    except Exception as e:
+        return {"error": "Failed to store sensor data", "exception": str(e)}
+
+
+async def store_direct_async(db, data: SensorDataIn) -> Dict[str, Any]:
     try:
-        r = requests.get(latest_url)
+        return _stored_response(await ingest_sensor_data_async(db, data))
+    except SensorNotFound:
+        return {"error": "Sensor not found", "status": 404}
+    except Exception as e:
+        return {"error": "Failed to store sensor data", "exception": str(e)}
+
+
+def store_direct_batch(items: List[SensorDataIn]) -> List[Dict[str, Any]]:
+    """store_direct for many reading sets in one round of writes."""
+    if _ingest_db is None:
+        return [{"error": "Direct ingestion not configured; call configure_ingestion(db)"} for _ in items]
+    try:
+        return _batch_responses(ingest_sensor_data_batch(_ingest_db, items))
+    except Exception as e:
+        return [_failed_response(e) for _ in items]
+
+
+async def store_direct_batch_async(db, items: List[SensorDataIn]) -> List[Dict[str, Any]]:
+    try:
+        return _batch_responses(await ingest_sensor_data_batch_async(db, items))
+    except Exception as e:
+        return [_failed_response(e) for _ in items]
+
+
+def store_via_api(data: SensorDataIn) -> Dict[str, Any]:
+    try:
+        res = http_session().post(API_URL, json=data.model_dump(mode="json", exclude_none=True), timeout=HTTP_TIMEOUT)
     except Exception as e:
         return {"error": "Failed to connect to API", "exception": str(e)}
+    return {"status": res.status_code, "response": res.json()}
 
-    # If no previous data exists
-    if r.status_code == 404:
-        res = requests.post(API_URL, json=data)
-        return {
-            "message": "First-time data sent",
-            "status": res.status_code,
-            "response": res.json()
-        }
-
-    if r.status_code != 200:
-        return {
-            "error": f"Failed to fetch latest data: {r.status_code}",
-            "response": r.text
-        }
-
-    # Compare current vs latest data
-    latest_data = r.json()
-    old_readings = {
-        reading["sensor_name"]: reading["reading"]
-        for reading in latest_data.get("readings", [])
-    }
 
-    new_readings = [
-        reading for reading in data.get("readings", [])
-        if reading["sensor_name"] not in old_readings
-        or is_significant_change(reading["reading"], old_readings[reading["sensor_name"]])
-    ]
+def changed_readings(data: SensorDataIn):
+    """(first_time, readings worth storing), compared against the last stored readings in memory."""
+    first_time = True
+    new_readings = []
+    for reading in data.readings:
+        last = last_readings.get(data.sensor_id, reading.sensor_name)
+        reason = deadband.evaluate(data.sensor_id, reading.model_dump(), last)
+        if reason != REASON_FIRST:
+            first_time = False
+        if reason != REASON_SUPPRESSED:
+            new_readings.append(reading)
+    return first_time, new_readings
 
+
+def _significant(payload: Dict[str, Any]):
+    """(data trimmed to its significant readings, first_time, None), or (None, _, result to return)."""
+    if not payload.get("sensor_id"):
+        return None, False, {"error": "sensor_id missing in payload"}
+    try:
+        data = SensorDataIn.model_validate(payload)
+    except ValidationError as e:
+        return None, False, {"error": "Invalid sensor data", "details": e.errors(include_url=False)}
+
+    first_time, new_readings = changed_readings(data)
     if not new_readings:
-        return {"message": "No significant change detected"}
+        return None, first_time, {"message": "No significant change detected"}
+    return data.model_copy(update={"readings": new_readings}), first_time, None
+
 
-    payload = {**data, "readings": new_readings}
-    res = requests.post(API_URL, json=payload)
+def _after_store(data: SensorDataIn, first_time: bool, result: Dict[str, Any]) -> Dict[str, Any]:
+    if result.get("status") == 200:
+        last_readings.update_from_document({**data.model_dump(), "created_at": data.created_at or datetime.now(timezone.utc)})
+
+    if "error" in result:
+        return result
     return {
-        "message": "Significant change detected and data sent",
-        "status": res.status_code,
-        "response": res.json()
+        "message": "First-time data sent" if first_time else "Significant change detected and data sent",
+        **result
     }
+
+
+# Main function to call from MQTT receiver
+def add_sensor_data_if_changed(payload: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+    data, first_time, result = _significant(payload)
+    if result:
+        return result
+
+    if (mode or INGEST_MODE) == "http":
+        result = store_via_api(data)
+    else:
+        result = store_direct(data)
+    return _after_store(data, first_time, result)
+
+
+async def add_sensor_data_if_changed_async(db, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """add_sensor_data_if_changed for the asyncio receiver, storing through the async database `db`."""
+    data, first_time, result = _significant(payload)
+    if result:
+        return result
+    return _after_store(data, first_time, await store_direct_async(db, data))
+
+
+def _significant_rounds(payloads: List[Dict[str, Any]]):
+    """
+    Split a batch for storing: yields (results, [(index, data, first_time)])
+    per round, with results already set for payloads that need no write.
+
+    A round holds at most one payload per sensor, and the next round is only
+    evaluated once the caller has stored this one, so each payload is compared
+    with the previous reading of its sensor as if they were sent one by one.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+    pending, sensors = [], set()
+    for i, payload in enumerate(payloads):
+        if payload.get("sensor_id") in sensors:
+            yield results, pending
+            pending, sensors = [], set()
+        data, first_time, result = _significant(payload)
+        if result:
+            results[i] = result
+            continue
+        pending.append((i, data, first_time))
+        sensors.add(data.sensor_id)
+    yield results, pending
+
+
+def _sensor_ids(payloads: List[Dict[str, Any]]):
+    return {payload["sensor_id"] for payload in payloads if payload.get("sensor_id")}
+
+
+def add_sensor_data_if_changed_batch(payloads: List[Dict[str, Any]], mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    add_sensor_data_if_changed for a batch, one result per payload. In direct
+    mode the significant readings are stored together (store_direct_batch).
+
+    The batch's sensors are first refreshed from the shared last readings,
+    so it does not matter which worker of a $share group got the messages.
+    Two workers judging readings of one sensor at the same moment can still
+    both compare against the same previous reading.
+    """
+    if _ingest_db is not None:
+        last_readings.refresh(_ingest_db[LAST_READINGS], _sensor_ids(payloads))
+    if (mode or INGEST_MODE) == "http":
+        return [add_sensor_data_if_changed(payload, mode="http") for payload in payloads]
+    results = []
+    for results, pending in _significant_rounds(payloads):
+        stored = store_direct_batch([data for _, data, _ in pending]) if pending else []
+        for (i, data, first_time), result in zip(pending, stored):
+            results[i] = _after_store(data, first_time, result)
+    return results
+
+
+async def add_sensor_data_if_changed_batch_async(db, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    await last_readings.refresh_async(db[LAST_READINGS], _sensor_ids(payloads))
+    results = []
+    for results, pending in _significant_rounds(payloads):
+        stored = await store_direct_batch_async(db, [data for _, data, _ in pending]) if pending else []
+        for (i, data, first_time), result in zip(pending, stored):
+            results[i] = _after_store(data, first_time, result)
+    return results
+
+
+def add_sensor_data_if_changed_via_api(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Same as add_sensor_data_if_changed, always going through the HTTP API."""
+    return add_sensor_data_if_changed(data, mode="http")